@@ -0,0 +1,377 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime, timezone
+
+from agent.clients import get_session
+from agent.boundaries import normalize_county
+
+
+NWS_ALERTS_URL = "https://api.weather.gov/alerts/active"
+
+# States polled in the background, comma separated two-letter codes
+ALERT_STATES = [s.strip().upper() for s in os.getenv("NWS_ALERT_STATES", "FL,TX").split(",") if s.strip()]
+POLL_SECONDS = float(os.getenv("NWS_POLL_SECONDS", 60))
+
+# Upper bound of tokens for an alert summary handed to the LLM
+ALERT_TOKEN_BUDGET = int(os.getenv("ALERT_TOKEN_BUDGET", 3000))
+
+# Per-group caps, longer texts are cut before the budget is applied
+DESCRIPTION_CHARS = 600
+INSTRUCTION_CHARS = 300
+
+SEVERITY_RANK = {"Extreme": 0, "Severe": 1, "Moderate": 2, "Minor": 3}
+URGENCY_RANK = {"Immediate": 0, "Expected": 1, "Future": 2, "Past": 3}
+CERTAINTY_RANK = {"Observed": 0, "Likely": 1, "Possible": 2, "Unlikely": 3}
+
+
+def extract_alerts(data):
+    alerts = []
+
+    for feature in data.get('features', []):
+        properties = feature.get('properties', {})
+
+        alert = {
+            "Event": properties.get("event"),
+            "Affected Areas": properties.get("areaDesc"),
+            "Severity": properties.get("severity"),
+            "Certainty": properties.get("certainty"),
+            "Urgency": properties.get("urgency"),
+            "Start Time": properties.get("onset"),
+            "End Time": properties.get("ends"),
+            "Headline": properties.get("headline"),
+            "Description": properties.get("description"),
+            "Instructions": properties.get("instruction"),
+            "Source": properties.get("senderName"),
+            # 6-digit SAME codes of the affected counties, "0" + state and county FIPS
+            "SAME": properties.get("geocode", {}).get("SAME", []),
+        }
+        alerts.append(alert)
+
+    return alerts
+
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional, fall back to the usual ~4 characters per token estimate
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+def _areas(alert) -> list:
+    return [area.strip() for area in (alert.get("Affected Areas") or "").split(";") if area.strip()]
+
+
+def filter_by_county(alerts: list, county: str, fips: str = None) -> list:
+    """
+    Alerts covering a county.
+
+    With the 5-digit county `fips` the SAME codes of the alerts are matched, otherwise
+    (and for alerts without SAME codes) the county name is looked up in the affected
+    areas, "Harris", "Harris County" and "harris" all match.
+    """
+    wanted = normalize_county(county)
+    same = f"0{fips}" if fips else None
+
+    def covers(alert):
+        if same and alert.get("SAME"):
+            return same in alert["SAME"]
+        return any(normalize_county(area) == wanted for area in _areas(alert))
+
+    return [alert for alert in alerts if covers(alert)]
+
+
+def _headline_key(headline: str) -> str:
+    # "Flood Watch issued October 8 at 4:05AM EDT until ... by NWS Tampa Bay Ruskin FL", the
+    # same watch is issued by every office covering it, only the sender and times differ
+    return re.sub(r"\s+(issued|by)\s.*$", "", headline or "", flags=re.IGNORECASE).strip().lower()
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+def group_alerts(alerts: list) -> list:
+    """
+    Merges near-identical alerts into one group per event, severity, urgency and headline.
+
+    Groups carry the union of their affected areas and the widest time window, and are
+    ranked by severity, urgency, certainty and then by how many areas they cover.
+    """
+    groups = {}
+    for alert in alerts:
+        key = (alert.get("Event"), alert.get("Severity"), alert.get("Urgency"), _headline_key(alert.get("Headline")))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {**alert, "Affected Areas": [], "Sources": [], "Count": 0}
+        group["Count"] += 1
+        for area in _areas(alert):
+            if area not in group["Affected Areas"]:
+                group["Affected Areas"].append(area)
+        if alert.get("Source") and alert["Source"] not in group["Sources"]:
+            group["Sources"].append(alert["Source"])
+        if alert.get("Start Time") and (not group.get("Start Time") or alert["Start Time"] < group["Start Time"]):
+            group["Start Time"] = alert["Start Time"]
+        if alert.get("End Time") and (not group.get("End Time") or alert["End Time"] > group["End Time"]):
+            group["End Time"] = alert["End Time"]
+        # Keep the most detailed texts of the group
+        for field in ("Description", "Instructions"):
+            if len(alert.get(field) or "") > len(group.get(field) or ""):
+                group[field] = alert[field]
+
+    return sorted(groups.values(), key=lambda g: (
+        SEVERITY_RANK.get(g.get("Severity"), len(SEVERITY_RANK)),
+        URGENCY_RANK.get(g.get("Urgency"), len(URGENCY_RANK)),
+        CERTAINTY_RANK.get(g.get("Certainty"), len(CERTAINTY_RANK)),
+        -len(g["Affected Areas"]),
+    ))
+
+
+def _render_group(group: dict, detailed: bool) -> str:
+    count = f" ({group['Count']} alerts)" if group["Count"] > 1 else ""
+    lines = [
+        f"- {group.get('Event')}{count}: {group.get('Severity')} severity, {group.get('Urgency')} urgency, "
+        f"{group.get('Certainty')} certainty",
+        f"  Areas: {'; '.join(group['Affected Areas'])}",
+        f"  From {group.get('Start Time') or 'now'} until {group.get('End Time') or 'further notice'}",
+    ]
+    if detailed:
+        if group.get("Headline"):
+            lines.append(f"  Headline: {group['Headline']}")
+        if group.get("Description"):
+            lines.append(f"  Description: {_shorten(group['Description'], DESCRIPTION_CHARS)}")
+        if group.get("Instructions"):
+            lines.append(f"  Instructions: {_shorten(group['Instructions'], INSTRUCTION_CHARS)}")
+        if group["Sources"]:
+            lines.append(f"  Source: {', '.join(group['Sources'])}")
+    return "\n".join(lines)
+
+
+def summarize_alerts(alerts: list, title: str, max_tokens: int = ALERT_TOKEN_BUDGET) -> str:
+    """
+    Renders the grouped alerts, most severe first, within `max_tokens`.
+
+    Groups are rendered in full while the budget allows, then without description and
+    instructions, and whatever still does not fit is only counted at the end.
+    """
+    groups = group_alerts(alerts)
+    parts = [f"{title}: {len(alerts)} alerts in {len(groups)} groups."]
+    used = count_tokens(parts[0])
+    # Room for the trailing "omitted" note
+    budget = max_tokens - 60
+
+    for i, group in enumerate(groups):
+        for detailed in (True, False):
+            text = _render_group(group, detailed)
+            tokens = count_tokens(text) + 1
+            if used + tokens <= budget:
+                parts.append(text)
+                used += tokens
+                break
+        else:
+            omitted = groups[i:]
+            events = sorted({g.get("Event") or "Unknown" for g in omitted})
+            more = f" and {len(events) - 5} more" if len(events) > 5 else ""
+            parts.append(f"... {len(omitted)} lower priority groups omitted: {', '.join(events[:5])}{more}.")
+            break
+
+    return "\n".join(parts)
+
+
+def _now() -> float:
+    return time.time()
+
+
+class AlertStore:
+    """
+    Active NWS alerts per state, keyed by alert id, with a change log for diffs.
+
+    Every `update` records which alerts are new, which replaced an earlier version
+    (same id re-sent, or a new id referencing a known one) and which left the feed.
+    """
+
+    def __init__(self, history_seconds: float = 24 * 3600):
+        self.history_seconds = history_seconds
+        self._active = {}
+        self._expired = {}
+        self._changes = {}
+        self._updated_at = {}
+        self._lock = threading.Lock()
+
+    def update(self, state: str, data: dict):
+        now = _now()
+        incoming = {}
+        for feature in data.get("features", []):
+            alert_id = feature.get("id") or feature.get("properties", {}).get("id")
+            incoming[alert_id] = feature
+
+        with self._lock:
+            active = self._active.get(state, {})
+            changes = self._changes.setdefault(state, [])
+
+            superseded = set()
+            for alert_id, feature in incoming.items():
+                properties = feature.get("properties", {})
+                references = {ref.get("identifier") or ref.get("@id") for ref in properties.get("references", [])}
+                replaces = references & active.keys()
+                superseded |= replaces
+
+                if alert_id not in active and not replaces:
+                    changes.append((now, "new", alert_id))
+                elif alert_id not in active or active[alert_id]["properties"].get("sent") != properties.get("sent"):
+                    changes.append((now, "updated", alert_id))
+
+            for alert_id in active.keys() - incoming.keys() - superseded:
+                changes.append((now, "expired", alert_id))
+
+            # Expired alerts are kept around for the change log only
+            expired = self._expired_features(state)
+            expired.update({alert_id: active[alert_id] for alert_id in active.keys() - incoming.keys()})
+
+            self._active[state] = incoming
+            self._updated_at[state] = now
+            self._prune(state, now)
+
+    def _expired_features(self, state):
+        return self._expired.setdefault(state, {})
+
+    def touch(self, state: str):
+        """Marks the alerts of a state as confirmed current without changes."""
+        with self._lock:
+            self._updated_at[state] = _now()
+
+    def clear(self):
+        with self._lock:
+            self._active.clear()
+            self._expired.clear()
+            self._changes.clear()
+            self._updated_at.clear()
+
+    def _prune(self, state, now):
+        cutoff = now - self.history_seconds
+        changes = [change for change in self._changes.get(state, []) if change[0] >= cutoff]
+        self._changes[state] = changes
+        referenced = {alert_id for _, _, alert_id in changes}
+        expired = self._expired_features(state)
+        for alert_id in list(expired):
+            if alert_id not in referenced:
+                del expired[alert_id]
+
+    def updated_at(self, state: str):
+        return self._updated_at.get(state)
+
+    def is_fresh(self, state: str, max_age: float = 3 * POLL_SECONDS) -> bool:
+        updated_at = self.updated_at(state)
+        return updated_at is not None and _now() - updated_at < max_age
+
+    def alerts(self, state: str) -> list:
+        """Active alerts of a state in the `extract_alerts` format."""
+        with self._lock:
+            features = list(self._active.get(state, {}).values())
+        return extract_alerts({"features": features})
+
+    def changes_since(self, state: str, since: float) -> dict:
+        """
+        Alerts that are new, updated or expired since the `since` epoch timestamp.
+
+        An alert changed several times only shows up under its latest change.
+        """
+        with self._lock:
+            latest = {}
+            for changed_at, kind, alert_id in self._changes.get(state, []):
+                if changed_at > since:
+                    latest[alert_id] = kind
+
+            active = self._active.get(state, {})
+            expired = self._expired_features(state)
+            diff = {"new": [], "updated": [], "expired": []}
+            for alert_id, kind in latest.items():
+                feature = active.get(alert_id) if kind != "expired" else expired.get(alert_id)
+                if feature is not None:
+                    diff[kind].append(feature)
+
+        return {kind: extract_alerts({"features": features}) for kind, features in diff.items()}
+
+
+alert_store = AlertStore()
+
+
+class AlertPoller:
+    """
+    Background poller of the active NWS alerts of `states`, feeding `alert_store`.
+
+    Uses ETag/Last-Modified conditional requests, so an unchanged feed costs a 304.
+    """
+
+    def __init__(self, states: list = None, poll_seconds: float = POLL_SECONDS, store: AlertStore = alert_store):
+        self.states = states or ALERT_STATES
+        self.poll_seconds = poll_seconds
+        self.store = store
+        self._validators = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def poll(self, state: str):
+        headers = {"Accept": "application/geo+json"}
+        etag, last_modified = self._validators.get(state, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        response = get_session().get(NWS_ALERTS_URL, params={"area": state}, headers=headers)
+        if response.status_code == 304:
+            # Nothing changed, the stored alerts are still current
+            self.store.touch(state)
+            return
+        response.raise_for_status()
+
+        self._validators[state] = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        self.store.update(state, response.json())
+
+    def clear(self):
+        """Forgets the ETag/Last-Modified validators, the next poll is unconditional."""
+        self._validators.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for state in self.states:
+                try:
+                    self.poll(state)
+                except Exception as e:
+                    print(f"NWS alert poll for {state} failed: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="nws-alert-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+alert_poller = AlertPoller()
+
+
+def start_alert_poller():
+    """Starts the background polling of the NWS alerts of NWS_ALERT_STATES."""
+    alert_poller.start()
+
+
+def parse_since(since: str) -> float:
+    """Parses an ISO 8601 timestamp (naive values are taken as UTC) into an epoch timestamp."""
+    parsed = datetime.fromisoformat(since.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
@@ -0,0 +1,172 @@
+import os
+import json
+import threading
+
+from agent.clients import get_session, get_async_client
+
+
+# Decimal places of returned WGS84 coordinates, ~0.1 m
+GEOMETRY_PRECISION = 6
+
+
+def query_params(where: str = "1=1", out_fields: list = None, return_geometry: bool = False, **params) -> dict:
+    """
+    Query parameters asking for only `out_fields` and, when `return_geometry` is set,
+    WGS84 geometry rounded to `GEOMETRY_PRECISION`. Extra `params` are passed as is.
+    """
+    query = {
+        "where": where,
+        "outFields": ",".join(out_fields) if out_fields else "*",
+        "returnGeometry": "true" if return_geometry else "false",
+        "f": "json",
+    }
+    if return_geometry:
+        query["outSR"] = 4326
+        query["geometryPrecision"] = GEOMETRY_PRECISION
+    query.update(params)
+    return query
+
+
+def to_records(data: dict) -> list:
+    """
+    Compact records of a query response: `attributes`, plus `lat`/`lng` for points
+    or the raw `geometry` for other shapes. Features without geometry keep only attributes.
+    """
+    records = []
+    for feature in data.get("features", []):
+        record = {"attributes": feature.get("attributes") or {}}
+        geometry = feature.get("geometry")
+        if geometry and "x" in geometry:
+            record["lat"] = geometry["y"]
+            record["lng"] = geometry["x"]
+        elif geometry:
+            record["geometry"] = geometry
+        records.append(record)
+    return records
+
+
+def _json(response) -> dict:
+    response.raise_for_status()
+    data = response.json()
+    if "error" in data:
+        raise RuntimeError(f"ArcGIS query failed: {data['error']}")
+    return data
+
+
+def _page_params(params: dict, fetched: int) -> dict:
+    # The first page goes without `resultOffset`, layers without pagination reject it
+    return {**params, "resultOffset": fetched} if fetched else params
+
+
+def _last_page(data: dict, paginate: bool) -> bool:
+    # GeoJSON responses carry the flag under `properties`
+    exceeded = data.get("exceededTransferLimit") or (data.get("properties") or {}).get("exceededTransferLimit")
+    return not paginate or not data.get("features") or not exceeded
+
+
+def _pages(layer: str, params: dict, operation: str = "query", paginate: bool = True):
+    """
+    Response of each page of a layer query, following `exceededTransferLimit` unless
+    `paginate` is False. Raises on HTTP errors and on ArcGIS errors returned with a 200.
+    """
+    fetched = 0
+    while True:
+        data = _json(get_session().get(f"{layer}/{operation}", params=_page_params(params, fetched)))
+        yield data
+        if _last_page(data, paginate):
+            return
+        fetched += len(data["features"])
+
+
+async def _apages(layer: str, params: dict, operation: str = "query", paginate: bool = True):
+    fetched = 0
+    while True:
+        data = _json(await get_async_client().get(f"{layer}/{operation}", params=_page_params(params, fetched)))
+        yield data
+        if _last_page(data, paginate):
+            return
+        fetched += len(data["features"])
+
+
+def query(layer: str, where: str = "1=1", out_fields: list = None, return_geometry: bool = False,
+          operation: str = "query", paginate: bool = True, **params) -> list:
+    """
+    Runs a layer query and returns its compact records (see `to_records`).
+
+    Pages are followed through `exceededTransferLimit` unless `paginate` is False,
+    e.g. for `queryTopFeatures` whose record count is already the wanted one.
+    Raises on HTTP errors and on ArcGIS errors returned with a 200.
+    """
+    base = query_params(where, out_fields, return_geometry, **params)
+    return [record for data in _pages(layer, base, operation, paginate) for record in to_records(data)]
+
+
+async def aquery(layer: str, where: str = "1=1", out_fields: list = None, return_geometry: bool = False,
+                 operation: str = "query", paginate: bool = True, **params) -> list:
+    """Async variant of `query` on the shared async client."""
+    base = query_params(where, out_fields, return_geometry, **params)
+    return [record async for data in _apages(layer, base, operation, paginate) for record in to_records(data)]
+
+
+def fetch_layer(source: str, where: str = "1=1", extra_params: dict = None, out_fields: list = None) -> list:
+    """
+    Downloads every feature of an ArcGIS layer as WGS84 GeoJSON (`f=geojson`), following
+    `exceededTransferLimit`.
+
+    `source` is either a FeatureServer/MapServer layer URL or a path to a local GeoJSON file,
+    the latter is used to run the syncs against fixtures. Only `out_fields` are fetched, all by default.
+    """
+    if os.path.exists(source):
+        with open(source) as f:
+            return json.load(f).get("features", [])
+
+    params = query_params(where, out_fields, return_geometry=True, f="geojson", **(extra_params or {}))
+    return [feature for data in _pages(source, params) for feature in data.get("features", [])]
+
+
+def query_ids(layer: str, where: str = "1=1", **params) -> list:
+    """Object ids of the features matching `where`, without their attributes or geometry."""
+    data = _json(get_session().get(f"{layer}/query", params={
+        "where": where, "returnIdsOnly": "true", "f": "json", **params,
+    }))
+    return data.get("objectIds") or []
+
+
+_fields = {}
+_fields_lock = threading.Lock()
+
+
+def _available(layer: str, fields: list, names) -> list:
+    if names is None:
+        return None
+    with _fields_lock:
+        _fields[layer] = names
+    return [field for field in fields if field in names]
+
+
+def available_fields(layer: str, fields: list):
+    """
+    The subset of `fields` the layer actually has, from its metadata (fetched once per layer).
+
+    Lets callers project onto fields whose exact name differs between layers, asking for a
+    missing field fails the whole query. Returns None when the metadata cannot be read.
+    """
+    names = _fields.get(layer)
+    if names is None:
+        try:
+            metadata = _json(get_session().get(layer, params={"f": "json"}))
+            names = {field["name"] for field in metadata.get("fields", [])}
+        except Exception as e:
+            print(f"Could not read the fields of {layer}: {e}")
+    return _available(layer, fields, names)
+
+
+async def aavailable_fields(layer: str, fields: list):
+    names = _fields.get(layer)
+    if names is None:
+        try:
+            metadata = _json(await get_async_client().get(layer, params={"f": "json"}))
+            names = {field["name"] for field in metadata.get("fields", [])}
+        except Exception as e:
+            print(f"Could not read the fields of {layer}: {e}")
+    return _available(layer, fields, names)
@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import argparse
+import threading
+
+import us
+
+from agent.arcgis import fetch_layer
+from agent.polygon_index import PolygonIndex
+
+
+# Census TIGERweb county boundaries, every county carries its state FIPS code
+COUNTY_LAYER = "https://tigerweb.geo.census.gov/arcgis/rest/services/TIGERweb/State_County/MapServer/1"
+
+BOUNDARIES_PATH = os.getenv(
+    "BOUNDARIES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "boundaries.geojson"),
+)
+
+# Generalization tolerance in degrees (~100 m), keeps the file small and lookups fast
+MAX_ALLOWABLE_OFFSET = 0.001
+
+# TIGER attributes kept per county
+COUNTY_FIELDS = ["STATE", "COUNTY", "GEOID", "BASENAME", "NAME"]
+
+STATE_ABBR_BY_FIPS = {state.fips: state.abbr for state in us.states.STATES_AND_TERRITORIES + [us.states.DC]}
+
+
+def normalize_county(name: str) -> str:
+    """Lowercase county name without its "County"/"Parish"/"Borough" suffix, for matching."""
+    return re.sub(r"\s+(county|parish|borough)$", "", name.strip(), flags=re.IGNORECASE).lower()
+
+
+def sync_boundaries(path: str = BOUNDARIES_PATH, states: list = None, source: str = COUNTY_LAYER) -> int:
+    """
+    Pulls the county boundaries and writes them to a local GeoJSON file.
+
+    `states` restricts the sync to some two-letter state codes, all states by default.
+    Returns the number of counties written.
+    """
+    where = "1=1"
+    fips = None
+    if states:
+        fips = {us.states.lookup(state).fips for state in states}
+        where = "STATE IN ({})".format(",".join(f"'{code}'" for code in sorted(fips)))
+
+    features = []
+    for feature in fetch_layer(source, where, {"maxAllowableOffset": MAX_ALLOWABLE_OFFSET}, COUNTY_FIELDS):
+        properties = feature.get("properties") or {}
+        state_fips = properties.get("STATE")
+        # Local files are not filtered by the `where` clause
+        if fips and state_fips not in fips:
+            continue
+        features.append({
+            "type": "Feature",
+            "properties": {
+                "state": STATE_ABBR_BY_FIPS.get(state_fips),
+                "state_fips": state_fips,
+                "county": properties.get("BASENAME") or properties.get("NAME"),
+                "county_fips": properties.get("COUNTY"),
+                "geoid": properties.get("GEOID"),
+            },
+            "geometry": feature.get("geometry"),
+        })
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    os.replace(tmp_path, path)
+
+    reset_index()
+    return len(features)
+
+
+_index = None
+_fips_by_name = None
+_lock = threading.Lock()
+
+
+def _load(path: str = BOUNDARIES_PATH):
+    global _index, _fips_by_name
+    if _index is None:
+        with _lock:
+            if _index is None:
+                features = []
+                if os.path.exists(path):
+                    with open(path) as f:
+                        features = json.load(f).get("features", [])
+                _fips_by_name = {
+                    (feature["properties"]["state"], normalize_county(feature["properties"]["county"])):
+                        feature["properties"]["geoid"]
+                    for feature in features if feature["properties"].get("county")
+                }
+                _index = PolygonIndex(features)
+    return _index
+
+
+def reset_index():
+    global _index, _fips_by_name
+    with _lock:
+        _index = None
+        _fips_by_name = None
+
+
+def is_available() -> bool:
+    """True when county boundaries have been synced."""
+    return len(_load().properties) > 0
+
+
+def resolve(latitude: float, longitude: float):
+    """
+    Resolves a point to its state and county from the local boundaries.
+
+    Returns:
+    --------
+    dict or None
+        `state` (two-letter code), `state_fips`, `county`, `county_fips` and `geoid`
+        (5-digit state + county FIPS), or None when the point is outside the synced counties.
+    """
+    matches = _load().query(latitude, longitude)
+    return dict(matches[0]) if matches else None
+
+
+def county_fips(state: str, county: str):
+    """5-digit FIPS code of a county by name ("Harris" or "Harris County"), None if unknown."""
+    _load()
+    return _fips_by_name.get((state.upper(), normalize_county(county)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the state/county boundaries to a local file")
+    parser.add_argument("--path", default=BOUNDARIES_PATH, help="Output GeoJSON file")
+    parser.add_argument("--state", action="append", default=[],
+                        help="Only sync this two-letter state code, can be repeated")
+    parser.add_argument("--source", default=COUNTY_LAYER,
+                        help="County layer URL or a local GeoJSON file with TIGER attributes")
+    args = parser.parse_args()
+
+    count = sync_boundaries(args.path, args.state, args.source)
+    print(f"Wrote {count} county boundaries to {args.path}")
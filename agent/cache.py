@@ -0,0 +1,201 @@
+import time
+import asyncio
+import inspect
+import threading
+import functools
+import weakref
+from collections import OrderedDict
+
+
+def normalize_value(value):
+    """
+    Case and whitespace insensitive form of string arguments, other values are kept as is.
+    Normalizer for the arguments a tool itself treats case-insensitively (addresses, state codes).
+    """
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(v) for v in value)
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class _Flight:
+    """A call in progress on a thread, the other callers of the same key wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ToolCache:
+    """
+    Single-flight TTL cache for tool functions, used as a decorator.
+
+    Calls are keyed by their normalized arguments. While a call is running, identical
+    calls wait for it instead of hitting the upstream again, and its result is then
+    served from an LRU bounded in size until `ttl` expires. The same instance can
+    decorate a sync tool and its async variant, they share the cached results.
+
+    Parameters:
+    ----------
+    name : str
+        Name reported in `cache_stats`.
+    ttl : float
+        Seconds a result stays valid.
+    maxsize : int
+        Max number of results kept, least recently used entries are evicted first.
+    normalizers : dict, optional
+        Argument name -> function applied to the argument before keying, e.g. to map
+        'Florida' and 'FL' to the same state. Normalized string arguments are also case
+        and whitespace insensitive (see `normalize_value`), the others are keyed as passed
+        since tools may forward them case-sensitively.
+    cache_if : callable, optional
+        Only results for which it returns True are cached, e.g. to skip error messages.
+        Exceptions are never cached.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 256, normalizers: dict = None, cache_if=None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.normalizers = normalizers or {}
+        self.cache_if = cache_if or (lambda result: True)
+        self._entries = OrderedDict()
+        self._flights = {}
+        # asyncio tasks are bound to their loop, in-flight calls are tracked per loop
+        self._async_flights = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        _caches[name] = self
+
+    def key(self, signature: inspect.Signature, args: tuple, kwargs: dict) -> tuple:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple(
+            (name, normalize_value(self.normalizers[name](value)) if name in self.normalizers else _hashable(value))
+            for name, value in bound.arguments.items()
+        )
+
+    def _lookup(self, key):
+        """Cached result of `key` or the `_MISSING` marker, called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            created, result = entry
+            if time.time() - created < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self._entries[key]
+        return _MISSING
+
+    def _store(self, key, result):
+        if not self.cache_if(result):
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __call__(self, fn):
+        signature = inspect.signature(fn)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await self._call_async(self.key(signature, args, kwargs), fn, args, kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self._call(self.key(signature, args, kwargs), fn, args, kwargs)
+        return wrapper
+
+    def _call(self, key, fn, args, kwargs):
+        with self._lock:
+            result = self._lookup(key)
+            if result is not _MISSING:
+                return result
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args, **kwargs)
+            self._store(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def _call_async(self, key, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            result = self._lookup(key)
+            if result is not _MISSING:
+                return result
+            flights = self._async_flights.setdefault(loop, {})
+            task = flights.get(key)
+            if task is None:
+                self.misses += 1
+                task = flights[key] = loop.create_task(fn(*args, **kwargs))
+                task.add_done_callback(functools.partial(self._finish_async, flights, key))
+            else:
+                self.coalesced += 1
+
+        # Shielded so a caller giving up does not cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    def _finish_async(self, flights, key, task):
+        with self._lock:
+            flights.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / calls if calls else 0.0,
+                "size": len(self._entries),
+            }
+
+
+_MISSING = object()
+_caches = {}
+
+
+def cache_stats() -> dict:
+    """Hit, miss and coalesce counts of every tool cache, by name."""
+    return {name: cache.stats() for name, cache in _caches.items()}
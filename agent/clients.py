@@ -0,0 +1,175 @@
+import os
+import asyncio
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import googlemaps
+
+from agent.resilience import upstream_for
+
+
+# (connect, read) timeouts in seconds applied to every outbound call that does not set its own
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 20))
+
+DEFAULT_POOL_SIZE = 10
+
+# Keep-alive pool size per upstream, sized after how often the tools hit each host
+HOST_POOL_SIZES = {
+    "https://maps.googleapis.com": 32,
+    "https://services.arcgis.com": 16,
+    "https://services5.arcgis.com": 16,
+    "https://www.fema.gov": 8,
+    "https://api.weather.gov": 8,
+    "http://localhost:5015": 8,
+}
+
+
+USER_AGENT = "CRISP/1.0 (Crisis Response and Intelligent Support Platform)"
+
+# Upper bound of concurrent outbound requests per event loop on the async client
+MAX_ASYNC_CONNECTIONS = int(os.getenv("HTTP_MAX_ASYNC_CONNECTIONS", 64))
+
+# Base URL of a local stub server (benchmarks/stub_server.py) receiving every upstream request instead
+STUB_URL = os.getenv("CRISP_STUB_URL")
+
+
+def stub_url(url) -> str:
+    """Rewrites `https://host/path?query` to `{CRISP_STUB_URL}/host/path?query`, unchanged when no stub is set."""
+    url = str(url)
+    if not STUB_URL:
+        return url
+    parts = urlsplit(url)
+    return f"{STUB_URL.rstrip('/')}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def _response_size(response, stream: bool) -> int:
+    # Streamed bodies are not read here, fall back to the announced length
+    length = response.headers.get("Content-Length")
+    if length or stream:
+        return int(length or 0)
+    return len(response.content)
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with per-host keep-alive pools, gzip and a default (connect, read) timeout.
+
+    Every request goes through the circuit breaker of its upstream, which also sets the
+    upstream's read deadline and may hedge slow GET requests (see agent.resilience).
+    """
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        self.timeout = timeout
+        self.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            # api.weather.gov rejects requests without an identifying User-Agent
+            "User-Agent": USER_AGENT,
+        })
+
+        self.mount("https://", HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE))
+        self.mount("http://", HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE))
+        for prefix, size in HOST_POOL_SIZES.items():
+            self.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+
+    def request(self, method, url, **kwargs):
+        upstream = upstream_for(url)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (CONNECT_TIMEOUT, upstream.deadline) if upstream.deadline else self.timeout
+
+        stream = bool(kwargs.get("stream"))
+        idempotent = method.upper() == "GET" and not stream
+        key = requests.Request(method, url, params=kwargs.get("params")).prepare().url if idempotent else None
+
+        def send():
+            response = super(PooledSession, self).request(method, stub_url(url), **kwargs)
+            upstream.count(_response_size(response, stream))
+            return response
+
+        return upstream.call(key, send, hedge=idempotent)
+
+
+_lock = threading.RLock()
+_clients = {}
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def get_session() -> PooledSession:
+    """Returns the process-wide pooled HTTP session."""
+    return _get_or_create("session", PooledSession)
+
+
+def get_gmaps_client() -> googlemaps.Client:
+    """Returns the process-wide googlemaps client, sharing the pooled session."""
+    return _get_or_create("gmaps", lambda: googlemaps.Client(
+        key=os.environ['GOOGLE_MAPS_API_KEY'],
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        requests_session=get_session(),
+    ))
+
+
+class ResilientAsyncClient(httpx.AsyncClient):
+    """httpx.AsyncClient sending through the circuit breakers and deadlines of agent.resilience."""
+
+    def build_request(self, method, url, **kwargs):
+        deadline = upstream_for(url).deadline
+        if deadline and kwargs.get("timeout", httpx.USE_CLIENT_DEFAULT) is httpx.USE_CLIENT_DEFAULT:
+            kwargs["timeout"] = httpx.Timeout(deadline, connect=CONNECT_TIMEOUT)
+        return super().build_request(method, url, **kwargs)
+
+    async def send(self, request, **kwargs):
+        upstream = upstream_for(request.url)
+        stream = bool(kwargs.get("stream"))
+        idempotent = request.method == "GET" and not stream
+        key = str(request.url) if idempotent else None
+        if STUB_URL:
+            request.url = httpx.URL(stub_url(request.url))
+
+        async def send():
+            response = await super(ResilientAsyncClient, self).send(request, **kwargs)
+            upstream.count(_response_size(response, stream))
+            return response
+
+        return await upstream.acall(key, send, hedge=idempotent)
+
+
+# httpx.AsyncClient pools are bound to the event loop that first used them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the async HTTP client of the running event loop.
+
+    Same defaults as the pooled session: keep-alive, gzip and (connect, read) timeouts.
+    The connection limit bounds how many requests the async tools run at once.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = ResilientAsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_ASYNC_CONNECTIONS, max_keepalive_connections=MAX_ASYNC_CONNECTIONS),
+            headers={
+                "Accept-Encoding": "gzip, deflate",
+                "User-Agent": USER_AGENT,
+            },
+        )
+        _async_clients[loop] = client
+    return client
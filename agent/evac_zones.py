@@ -0,0 +1,110 @@
+import os
+import json
+import argparse
+import threading
+
+from agent.arcgis import available_fields, fetch_layer
+from agent.polygon_index import PolygonIndex
+
+
+# State -> ArcGIS FeatureServer layer holding its hurricane evacuation zones
+ZONE_LAYERS = {
+    "FL": "https://services.arcgis.com/3wFbqsFPLeKqOlIK/arcgis/rest/services/KYZ_ZL_Vector_Enriched_Calculated_20230608/FeatureServer/28",
+    "TX": "https://services.arcgis.com/su8ic9KbA7PYVxPS/arcgis/rest/services/HurricaneEvac_Zones/FeatureServer/0",
+}
+
+# Zone name attribute, named differently on each state's layer
+ZONE_FIELDS = ["Zone", "EZone", "zone"]
+
+EVAC_ZONES_PATH = os.getenv(
+    "EVAC_ZONES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "evac_zones.geojson"),
+)
+
+
+def sync_zones(path: str = EVAC_ZONES_PATH, sources: dict = None) -> int:
+    """
+    Pulls the evacuation zone layers and writes them to a single local GeoJSON file.
+
+    Only the state and zone name are kept per feature. Returns the number of features written.
+    """
+    sources = sources or ZONE_LAYERS
+    features = []
+    for state, source in sources.items():
+        out_fields = None if os.path.exists(source) else available_fields(source, ZONE_FIELDS)
+        for feature in fetch_layer(source, out_fields=out_fields):
+            properties = feature.get("properties") or {}
+            zone = next((properties[field] for field in ZONE_FIELDS if properties.get(field)), None)
+            features.append({
+                "type": "Feature",
+                "properties": {"state": state, "zone": zone},
+                "geometry": feature.get("geometry"),
+            })
+        print(f"Fetched evacuation zones for {state}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    os.replace(tmp_path, path)
+
+    # Drop the loaded index so the next lookup picks up the new file
+    reset_index()
+    return len(features)
+
+
+_indexes = None
+_lock = threading.Lock()
+
+
+def load_indexes(path: str = EVAC_ZONES_PATH) -> dict:
+    """Loads the local evacuation zone file into one PolygonIndex per state, empty if it was never synced."""
+    global _indexes
+    if _indexes is None:
+        with _lock:
+            if _indexes is None:
+                by_state = {}
+                if os.path.exists(path):
+                    with open(path) as f:
+                        for feature in json.load(f).get("features", []):
+                            by_state.setdefault(feature["properties"]["state"], []).append(feature)
+                _indexes = {state: PolygonIndex(features) for state, features in by_state.items()}
+    return _indexes
+
+
+def reset_index():
+    global _indexes
+    with _lock:
+        _indexes = None
+
+
+def find_zones(state: str, latitude: float, longitude: float):
+    """
+    Looks up the evacuation zones containing a point from the local index.
+
+    Returns:
+    --------
+    set or None
+        Zone names containing the point (empty if none), or None when no local data
+        exists for the state and the caller has to fall back to the live ArcGIS layer.
+    """
+    index = load_indexes().get(state)
+    if index is None:
+        return None
+    return {properties["zone"] for properties in index.query(latitude, longitude) if properties.get("zone")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync hurricane evacuation zones to a local file")
+    parser.add_argument("--path", default=EVAC_ZONES_PATH, help="Output GeoJSON file")
+    parser.add_argument("--source", action="append", default=[],
+                        help="Override a layer as STATE=URL_OR_GEOJSON_PATH, can be repeated")
+    args = parser.parse_args()
+
+    sources = dict(ZONE_LAYERS)
+    for override in args.source:
+        state, source = override.split("=", 1)
+        sources[state.upper()] = source
+
+    count = sync_zones(args.path, sources)
+    print(f"Wrote {count} evacuation zone features to {args.path}")
@@ -0,0 +1,183 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.clients import get_session, get_async_client
+from agent.map_utils import nearest_k
+from agent.shelters import shelter_mirror
+from agent import poi_store
+
+
+PLACES_NEARBY_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+
+# Facility category -> Google Places type
+FACILITY_TYPES = {
+    "hospital": "hospital",
+    "fire_station": "fire_station",
+    "police": "police",
+    "pharmacy": "pharmacy",
+}
+
+# Places has no shelter type, open shelters come from the shelter mirror when it is fresh
+SHELTER_KEYWORD = "emergency shelter"
+
+CATEGORIES = [*FACILITY_TYPES, "shelter"]
+
+# Spelled-out variants the LLM tends to pass
+CATEGORY_ALIASES = {
+    "hospitals": "hospital",
+    "fire station": "fire_station",
+    "fire stations": "fire_station",
+    "fire_stations": "fire_station",
+    "firestation": "fire_station",
+    "police station": "police",
+    "police_station": "police",
+    "pharmacies": "pharmacy",
+    "shelters": "shelter",
+}
+
+
+def normalize_categories(categories) -> list:
+    """Maps the requested categories to known ones, keeping their order. Raises ValueError on unknown ones."""
+    if not categories:
+        return list(CATEGORIES)
+    if isinstance(categories, str):
+        categories = categories.split(",")
+
+    normalized = []
+    for category in categories:
+        key = category.strip().lower()
+        key = CATEGORY_ALIASES.get(key, key)
+        if key not in CATEGORIES:
+            raise ValueError(f"Unknown facility category '{category}', expected one of {', '.join(CATEGORIES)}")
+        if key not in normalized:
+            normalized.append(key)
+    return normalized
+
+
+def _nearby_params(latitude: float, longitude: float, category: str) -> dict:
+    params = {
+        "location": f"{latitude},{longitude}",
+        # Closest first instead of most prominent, the radius is implied
+        "rankby": "distance",
+        "key": os.environ['GOOGLE_MAPS_API_KEY'],
+    }
+    if category == "shelter":
+        params["keyword"] = SHELTER_KEYWORD
+    else:
+        params["type"] = FACILITY_TYPES[category]
+    return params
+
+
+def _parse_nearby(latitude: float, longitude: float, data: dict, count: int) -> list:
+    """Turns a Places Nearby response into facility dicts, using the vicinity as address."""
+    if data.get("status") not in ("OK", "ZERO_RESULTS"):
+        raise RuntimeError(f"Places search failed: {data.get('status')} {data.get('error_message', '')}".strip())
+
+    places = [p for p in data.get("results", []) if p.get("geometry")]
+    if not places:
+        return []
+
+    indices, distances = nearest_k(
+        latitude, longitude,
+        [p["geometry"]["location"]["lat"] for p in places],
+        [p["geometry"]["location"]["lng"] for p in places],
+        count,
+    )
+    return [
+        {
+            "name": places[i].get("name"),
+            "address": places[i].get("vicinity"),
+            "lat": places[i]["geometry"]["location"]["lat"],
+            "lng": places[i]["geometry"]["location"]["lng"],
+            "miles": round(float(distance), 1),
+            "open_now": places[i].get("opening_hours", {}).get("open_now"),
+        }
+        for i, distance in zip(indices, distances)
+    ]
+
+
+def _mirrored_shelters(latitude: float, longitude: float, count: int):
+    shelters = shelter_mirror.nearest(latitude, longitude, count)
+    if shelters is None:
+        return None
+
+    facilities = []
+    for attributes, lat, lng, miles in shelters:
+        address = " ".join(str(attributes[k]) for k in ["Address", "City", "State", "Zip"] if attributes.get(k))
+        facilities.append({
+            "name": attributes.get("ShelterName"),
+            "address": address,
+            "lat": float(lat),
+            "lng": float(lng),
+            "miles": round(float(miles), 1),
+            "open_now": True,
+        })
+    return facilities
+
+
+def _local_facilities(latitude: float, longitude: float, category: str, count: int):
+    """Facilities from the local sources, or None when the caller has to ask Places."""
+    if category == "shelter":
+        return _mirrored_shelters(latitude, longitude, count)
+    if poi_store.has_category(category):
+        # Nothing stored nearby can also mean the dataset does not cover the area
+        return poi_store.nearest(latitude, longitude, category, count) or None
+    return None
+
+
+def search_category(latitude: float, longitude: float, category: str, count: int = 5) -> list:
+    """
+    Nearest facilities of one category, closest first.
+
+    Answered from the shelter mirror or the local POI store when they have data,
+    Google Places is only asked otherwise.
+    """
+    local = _local_facilities(latitude, longitude, category, count)
+    if local is not None:
+        return local
+
+    response = get_session().get(PLACES_NEARBY_URL, params=_nearby_params(latitude, longitude, category))
+    response.raise_for_status()
+    return _parse_nearby(latitude, longitude, response.json(), count)
+
+
+async def asearch_category(latitude: float, longitude: float, category: str, count: int = 5) -> list:
+    """Async variant of `search_category` using the async HTTP client."""
+    local = _local_facilities(latitude, longitude, category, count)
+    if local is not None:
+        return local
+
+    response = await get_async_client().get(PLACES_NEARBY_URL, params=_nearby_params(latitude, longitude, category))
+    response.raise_for_status()
+    return _parse_nearby(latitude, longitude, response.json(), count)
+
+
+def find_facilities(latitude: float, longitude: float, categories: list, count: int = 5) -> dict:
+    """
+    Searches every category around a point concurrently.
+
+    Returns:
+    --------
+    dict
+        Category -> list of facilities (closest first), or the exception raised by that
+        category's search so one failing category does not hide the others.
+    """
+    with ThreadPoolExecutor(max_workers=len(categories) or 1) as executor:
+        futures = {c: executor.submit(search_category, latitude, longitude, c, count) for c in categories}
+
+    results = {}
+    for category, future in futures.items():
+        try:
+            results[category] = future.result()
+        except Exception as e:
+            results[category] = e
+    return results
+
+
+async def afind_facilities(latitude: float, longitude: float, categories: list, count: int = 5) -> dict:
+    """Async variant of `find_facilities`, the searches share the event loop instead of threads."""
+    results = await asyncio.gather(
+        *(asearch_category(latitude, longitude, c, count) for c in categories), return_exceptions=True
+    )
+    return dict(zip(categories, results))
@@ -0,0 +1,186 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from agent.clients import get_session
+
+
+FEMA_DECLARATIONS_URL = "https://www.fema.gov/api/open/v2/DisasterDeclarationsSummaries"
+
+FEMA_MIRROR_DB = os.getenv("FEMA_MIRROR_DB")
+
+# Records per OpenFEMA page while syncing, the API caps $top at 10000
+SYNC_PAGE_SIZE = 10000
+
+COLUMNS = [
+    "id", "disasterNumber", "femaDeclarationString", "state", "declarationType", "declarationTitle",
+    "incidentType", "declarationDate", "incidentBeginDate", "incidentEndDate", "designatedArea",
+    "fipsStateCode", "fipsCountyCode", "ihProgramDeclared", "iaProgramDeclared", "paProgramDeclared",
+    "hmProgramDeclared", "region", "lastRefresh",
+]
+
+BOOL_COLUMNS = {"ihProgramDeclared", "iaProgramDeclared", "paProgramDeclared", "hmProgramDeclared"}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS declarations (
+    {", ".join("designatedArea TEXT COLLATE NOCASE" if c == "designatedArea" else f"{c}" for c in COLUMNS)},
+    PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS idx_declarations_state ON declarations (state, declarationType, declarationDate);
+CREATE INDEX IF NOT EXISTS idx_declarations_type ON declarations (declarationType);
+CREATE INDEX IF NOT EXISTS idx_declarations_incident ON declarations (incidentType);
+CREATE INDEX IF NOT EXISTS idx_declarations_area ON declarations (designatedArea);
+CREATE INDEX IF NOT EXISTS idx_declarations_county ON declarations (state, fipsCountyCode);
+CREATE INDEX IF NOT EXISTS idx_declarations_date ON declarations (declarationDate);
+CREATE INDEX IF NOT EXISTS idx_declarations_refresh ON declarations (lastRefresh);
+CREATE TABLE IF NOT EXISTS sync_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+# One connection per database file, shared by all threads under the lock
+_connections = {}
+_lock = threading.Lock()
+
+
+@contextmanager
+def _connect(db_path: str):
+    """Holds the lock on the shared connection to `db_path`, creating its schema on first use."""
+    with _lock:
+        conn = _connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.executescript(SCHEMA)
+            _connections[db_path] = conn
+        yield conn
+
+
+def _get_meta(conn, key):
+    row = conn.execute("SELECT value FROM sync_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def sync(db_path: str = FEMA_MIRROR_DB) -> int:
+    """
+    Incrementally syncs the OpenFEMA declarations into the SQLite mirror.
+
+    Only records refreshed at or after the newest `lastRefresh` already mirrored are
+    downloaded, the first run pulls the whole dataset. Returns the number of upserted rows.
+    """
+    with _connect(db_path) as conn:
+        since = conn.execute("SELECT MAX(lastRefresh) FROM declarations").fetchone()[0]
+
+    # Thousands of records share a lastRefresh, the id makes the order total so $skip
+    # pages neither skip nor repeat records
+    params = {"$orderby": "lastRefresh,id", "$top": SYNC_PAGE_SIZE}
+    if since:
+        # ge, not gt: an interrupted sync may have stored only part of the newest refresh,
+        # the records it already has are just upserted again
+        params["$filter"] = f"lastRefresh ge '{since}'"
+
+    upserted = 0
+    skip = 0
+    while True:
+        response = get_session().get(FEMA_DECLARATIONS_URL, params={**params, "$skip": skip}, timeout=(5, 120))
+        response.raise_for_status()
+        page = response.json().get("DisasterDeclarationsSummaries", [])
+
+        # Locked per page only, queries keep being served while the next page downloads
+        with _connect(db_path) as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO declarations ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                [tuple(record.get(c) for c in COLUMNS) for record in page],
+            )
+            conn.commit()
+        upserted += len(page)
+        skip += len(page)
+        if len(page) < SYNC_PAGE_SIZE:
+            break
+
+    with _connect(db_path) as conn:
+        conn.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('last_sync', ?)", (str(time.time()),))
+        conn.commit()
+    return upserted
+
+
+def is_available(db_path: str = FEMA_MIRROR_DB) -> bool:
+    """True when a mirror database is configured and has been synced at least once."""
+    if not db_path or not os.path.exists(db_path):
+        return False
+    with _connect(db_path) as conn:
+        return _get_meta(conn, "last_sync") is not None
+
+
+def end_of_day(endDate: str) -> str:
+    """Upper `declarationDate` bound, bare dates include the whole end day."""
+    return endDate if "T" in endDate else f"{endDate}T23:59:59.999Z"
+
+
+def query(state: str, declarationType: str = None, limit: int = 10, county: str = None,
+          incidentType: str = None, startDate: str = None, endDate: str = None,
+          countyFips: str = None, db_path: str = FEMA_MIRROR_DB) -> list:
+    """
+    Latest declarations from the mirror, newest first.
+
+    `county` matches the start of `designatedArea` ("Harris" matches "Harris (County)"),
+    the 3-digit `countyFips` takes precedence and also matches statewide declarations,
+    `startDate`/`endDate` are ISO dates bounding `declarationDate`.
+    """
+    clauses, args = ["state = ?"], [state.upper()]
+    if declarationType:
+        clauses.append("declarationType = ?")
+        args.append(declarationType.upper())
+    if countyFips:
+        clauses.append("fipsCountyCode IN (?, '000')")
+        args.append(countyFips)
+    elif county:
+        clauses.append("designatedArea LIKE ?")
+        args.append(f"{county}%")
+    if incidentType:
+        clauses.append("incidentType = ? COLLATE NOCASE")
+        args.append(incidentType)
+    if startDate:
+        clauses.append("declarationDate >= ?")
+        args.append(startDate)
+    if endDate:
+        clauses.append("declarationDate <= ?")
+        args.append(end_of_day(endDate))
+
+    with _connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM declarations WHERE {' AND '.join(clauses)} ORDER BY declarationDate DESC LIMIT ?",
+            (*args, limit),
+        ).fetchall()
+    # SQLite stores the program flags as 0/1
+    return [{k: bool(v) if k in BOOL_COLUMNS and v is not None else v for k, v in dict(row).items()}
+            for row in rows]
+
+
+def freshness(db_path: str = FEMA_MIRROR_DB) -> str:
+    """Human readable freshness of the mirror, for the tool output."""
+    with _connect(db_path) as conn:
+        last_sync = _get_meta(conn, "last_sync")
+        last_refresh = conn.execute("SELECT MAX(lastRefresh) FROM declarations").fetchone()[0]
+
+    if last_sync is None:
+        return "Local FEMA mirror has never been synced."
+    synced_at = datetime.fromtimestamp(float(last_sync), tz=timezone.utc)
+    minutes = int((time.time() - float(last_sync)) // 60)
+    return (f"Data from local FEMA mirror, synced {synced_at:%Y-%m-%d %H:%M} UTC ({minutes} min ago), "
+            f"latest FEMA refresh {last_refresh}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the OpenFEMA disaster declarations mirror")
+    parser.add_argument("command", choices=["sync", "status"])
+    parser.add_argument("--db", default=FEMA_MIRROR_DB, required=FEMA_MIRROR_DB is None,
+                        help="SQLite database path (defaults to FEMA_MIRROR_DB)")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        print(f"Upserted {sync(args.db)} declarations into {args.db}")
+    print(freshness(args.db))
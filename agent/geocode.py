@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from agent.clients import get_gmaps_client, get_async_client
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalizes an address string so trivially different spellings share a cache entry.
+
+    Lower-cases, drops punctuation (except '#') and collapses whitespace, e.g.
+    '151 Hex Road,  FL 70465' and '151 hex road fl 70465' map to the same key.
+    """
+    address = re.sub(r"[^\w\s#]", " ", str(address).lower())
+    return " ".join(address.split())
+
+
+class GeocodeCache:
+    """
+    Two tier geocode cache: an in-memory LRU with TTL in front of an optional SQLite table.
+
+    Parameters:
+    ----------
+    maxsize : int
+        Max number of entries kept in memory, least recently used entries are evicted first.
+    ttl : float
+        Seconds an entry stays valid, in memory and on disk.
+    db_path : str, optional
+        Path of the SQLite file used as the persistent tier. Disabled when None.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 7 * 24 * 3600, db_path: str = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, created FROM geocode_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    result = json.loads(row[0])
+                    self._put(key, result, row[1])
+                    self.disk_hits += 1
+                    return result
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, result):
+        created = time.time()
+        with self._lock:
+            self._put(key, result, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (key, result, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(result), created),
+                )
+                self._db.commit()
+
+    def _put(self, key, result, created):
+        self._entries[key] = (created, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM geocode_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+geocode_cache = GeocodeCache(
+    maxsize=int(os.getenv("GEOCODE_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("GEOCODE_CACHE_TTL", 7 * 24 * 3600)),
+    db_path=os.getenv("GEOCODE_CACHE_DB"),
+)
+
+
+def geocode(address: str) -> list:
+    """
+    Geocodes an address through the shared cache.
+
+    Returns the same list of results as `googlemaps.Client.geocode`, an empty list
+    if Google could not resolve the address. Empty results are not cached.
+    """
+    key = normalize_address(address)
+    result = geocode_cache.get(key)
+    if result is not None:
+        return result
+
+    result = get_gmaps_client().geocode(address)
+    if result:
+        geocode_cache.set(key, result)
+    return result
+
+
+async def ageocode(address: str) -> list:
+    """Async variant of `geocode`, calling the Geocoding API over the async HTTP client on a miss."""
+    key = normalize_address(address)
+    result = geocode_cache.get(key)
+    if result is not None:
+        return result
+
+    response = await get_async_client().get(
+        "https://maps.googleapis.com/maps/api/geocode/json",
+        params={"address": address, "key": os.environ['GOOGLE_MAPS_API_KEY']},
+    )
+    response.raise_for_status()
+    data = response.json()
+    if data.get("status") not in ("OK", "ZERO_RESULTS"):
+        raise RuntimeError(f"Geocoding failed: {data.get('status')} {data.get('error_message', '')}")
+
+    result = data.get("results", [])
+    if result:
+        geocode_cache.set(key, result)
+    return result
+
+
+def geocode_stats() -> dict:
+    """Returns hit/miss counters of the shared geocode cache."""
+    return geocode_cache.stats()
@@ -1,5 +1,5 @@
 import operator
-from typing import Annotated, List, TypedDict
+from typing import Annotated, List, Optional, TypedDict
 
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage, ToolMessage
@@ -24,6 +24,18 @@ dotenv.load_dotenv('../.env')
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
+    # Last location resolved by a tool (see agent.location), reused by the follow-up questions
+    location: Optional[dict]
+
+
+def remember_location(state: State) -> dict:
+    """Keeps the location returned by this turn's location tools in the graph state."""
+    for message in reversed(state["messages"]):
+        if not isinstance(message, ToolMessage):
+            break
+        if isinstance(message.artifact, dict) and "lat" in message.artifact:
+            return {"location": message.artifact}
+    return {}
 
 
 def handle_tool_error(state) -> dict:
@@ -96,13 +108,15 @@ def create_graph(tools:list,
     # Define nodes: these do the work
     builder.add_node("assistant", Assistant(assistant_runnable))
     builder.add_node("tools", create_tool_node_with_fallback(tools))
+    builder.add_node("remember_location", remember_location)
     # Define edges: these determine how the control flow moves
     builder.add_edge(START, "assistant")
     builder.add_conditional_edges(
         "assistant",
         tools_condition,
     )
-    builder.add_edge("tools", "assistant")
+    builder.add_edge("tools", "remember_location")
+    builder.add_edge("remember_location", "assistant")
 
     # The checkpointer lets the graph persist its state
     # this is a complete memory for the entire graph.
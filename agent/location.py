@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from agent import boundaries
+from agent.geocode import geocode, ageocode, normalize_address
+from agent.map_utils import gmaps_to_arcgis
+
+
+# Seconds without a message after which a sender's location is forgotten
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", 30 * 60))
+
+
+def _component(result: dict, kind: str, name: str = "short_name"):
+    for comp in result.get("address_components", []):
+        if kind in comp["types"]:
+            return comp[name]
+    return None
+
+
+def from_geocode(address: str, geocode_result: list) -> dict:
+    """
+    Location of the first geocoding result: `address` as given, `formatted_address`,
+    `lat`/`lng`, two-letter `state`, `county` and the Web Mercator `x`/`y` the ArcGIS
+    layers are queried with. State and county come from the local boundaries when
+    they cover the point, else from the address components.
+    """
+    result = geocode_result[0]
+    latitude = result['geometry']['location']['lat']
+    longitude = result['geometry']['location']['lng']
+    place = boundaries.resolve(latitude, longitude) or {}
+    x, y = gmaps_to_arcgis(latitude, longitude)
+
+    return {
+        "address": address,
+        "formatted_address": result.get("formatted_address"),
+        "lat": latitude,
+        "lng": longitude,
+        "state": place.get("state") or _component(result, "administrative_area_level_1"),
+        "county": place.get("county") or _component(result, "administrative_area_level_2", "long_name"),
+        "x": x,
+        "y": y,
+    }
+
+
+def remembered(session: dict, address: str = None):
+    """
+    The location kept in the graph state, when `address` is empty or is the address it
+    was resolved from. None otherwise.
+    """
+    location = (session or {}).get("location")
+    if not location:
+        return None
+    if address and normalize_address(address) not in (
+        normalize_address(location["address"]), normalize_address(location.get("formatted_address") or "")
+    ):
+        return None
+    return location
+
+
+def resolve(address: str = None, session: dict = None):
+    """
+    Location of `address`, reusing the one already resolved in this conversation instead
+    of geocoding again. None when there is neither an address nor a remembered location,
+    or when the address cannot be geocoded.
+    """
+    location = remembered(session, address)
+    if location is None and address:
+        geocode_result = geocode(address)
+        if geocode_result:
+            location = from_geocode(address, geocode_result)
+    return location
+
+
+async def aresolve(address: str = None, session: dict = None):
+    location = remembered(session, address)
+    if location is None and address:
+        geocode_result = await ageocode(address)
+        if geocode_result:
+            location = from_geocode(address, geocode_result)
+    return location
+
+
+def point_key(location: dict) -> tuple:
+    """Stands in for a location in cache keys: lookups around the same point share results."""
+    return (location["lat"], location["lng"])
+
+
+def cache_key(session: dict):
+    """Stands in for the graph state in tool cache keys: only its location changes the result."""
+    location = (session or {}).get("location")
+    return point_key(location) if location else None
+
+
+class SessionLocations:
+    """
+    Last location resolved for each sender, kept across their messages.
+
+    An entry expires once its sender has been idle for `idle_seconds`, every read or
+    write restarts the clock. At most `maxsize` senders are kept, the least recently
+    active are dropped first.
+    """
+
+    def __init__(self, idle_seconds: float = SESSION_IDLE_SECONDS, maxsize: int = 10000):
+        self.idle_seconds = idle_seconds
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sender: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sender)
+            if entry is None:
+                return None
+            seen, location = entry
+            if now - seen >= self.idle_seconds:
+                del self._entries[sender]
+                return None
+            self._entries[sender] = (now, location)
+            self._entries.move_to_end(sender)
+            return location
+
+    def set(self, sender: str, location: dict):
+        with self._lock:
+            self._entries[sender] = (time.time(), location)
+            self._entries.move_to_end(sender)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
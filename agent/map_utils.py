@@ -1,74 +1,174 @@
-import math
-import requests
+import numpy as np
 
-def arcgis_to_gmaps(x, y):
-    R = 6378137  # Earth's radius in meters
+from agent.clients import get_session, get_async_client
 
-    # Convert longitude
-    longitude = (x / R) * (180 / math.pi)
 
-    # Convert latitude
-    latitude = math.degrees(math.atan(math.sinh(y / R)))
+WEB_MERCATOR_RADIUS = 6378137  # Earth's radius in meters used by Web Mercator (EPSG:3857)
+EARTH_RADIUS_MILES = 3958.7613
+METERS_PER_MILE = 1609.344
 
-    return latitude, longitude
+# Distance Matrix API accepts at most 25 destinations per request
+MAX_DESTINATIONS = 25
 
-def gmaps_to_arcgis(latitude, longitude):
-    R = 6378137  # Earth's radius in meters
 
-    # Convert longitude to Web Mercator x
-    x = math.radians(longitude) * R
+def web_mercator_to_wgs84(x, y):
+    """
+    Converts Web Mercator coordinates, as returned by ArcGIS, to WGS84.
+
+    Parameters:
+        x (array-like): Web Mercator x values in meters.
+        y (array-like): Web Mercator y values in meters.
+
+    Returns:
+        tuple: (latitudes, longitudes) arrays in degrees.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    longitudes = np.degrees(x / WEB_MERCATOR_RADIUS)
+    latitudes = np.degrees(np.arctan(np.sinh(y / WEB_MERCATOR_RADIUS)))
+    return latitudes, longitudes
+
 
-    # Convert latitude to Web Mercator y
-    y = math.log(math.tan((math.pi / 4) + math.radians(latitude) / 2)) * R
+def wgs84_to_web_mercator(latitudes, longitudes):
+    """
+    Converts WGS84 coordinates to Web Mercator.
 
+    Parameters:
+        latitudes (array-like): Latitudes in degrees.
+        longitudes (array-like): Longitudes in degrees.
+
+    Returns:
+        tuple: (x, y) arrays in meters.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+
+    x = np.radians(longitudes) * WEB_MERCATOR_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(latitudes) / 2)) * WEB_MERCATOR_RADIUS
     return x, y
 
-def get_distance_google_maps(api_key, origin, destination, mode="driving"):
+
+def gmaps_to_arcgis(latitude, longitude):
+    x, y = wgs84_to_web_mercator(latitude, longitude)
+    return float(x), float(y)
+
+
+def haversine_miles(latitude, longitude, latitudes, longitudes):
     """
-    Get the distance between two points using Google Maps Distance Matrix API.
+    Great-circle distance in miles between points, broadcasting over arrays.
+
+    Typically one origin against an array of candidates, but the origin can be an
+    array of the same shape for pairwise distances.
 
     Parameters:
-        api_key (str): Google Maps API key.
-        origin (str): Origin location (latitude,longitude or address).
-        destination (str): Destination location (latitude,longitude or address).
-        mode (str): Travel mode (driving, walking, bicycling, transit).
+        latitude (float or array-like): Latitude of the origin.
+        longitude (float or array-like): Longitude of the origin.
+        latitudes (array-like): Latitudes of the candidates.
+        longitudes (array-like): Longitudes of the candidates.
+
+    Returns:
+        np.ndarray: Distance to every candidate, in miles.
+    """
+    lat1 = np.radians(np.asarray(latitude, dtype=float))
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(longitudes, dtype=float) - np.asarray(longitude, dtype=float))
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def nearest_k(latitude, longitude, latitudes, longitudes, k, max_miles=None):
+    """
+    The `k` candidates closest to a point, in one vectorized pass.
+
+    Parameters:
+        latitude (float): Latitude of the origin.
+        longitude (float): Longitude of the origin.
+        latitudes (array-like): Latitudes of the candidates.
+        longitudes (array-like): Longitudes of the candidates.
+        k (int): Number of candidates to return.
+        max_miles (float, optional): Drop candidates farther than this.
 
     Returns:
-        dict: Distance and travel time.
+        tuple: (indices, distances) arrays into the candidates, closest first.
     """
-    # Google Maps Distance Matrix API endpoint
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+    distances = haversine_miles(latitude, longitude, latitudes, longitudes)
+    indices = np.arange(distances.size)
+    if max_miles is not None:
+        within = distances <= max_miles
+        indices, distances = indices[within], distances[within]
+
+    if k < distances.size:
+        # Partial selection first, only the k survivors are sorted
+        top = np.argpartition(distances, k)[:k]
+        indices, distances = indices[top], distances[top]
+    order = np.argsort(distances, kind="stable")
+    return indices[order], distances[order]
+
 
-    # Query parameters
-    params = {
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+
+def _distance_matrix_params(api_key, origin, destinations, mode):
+    if len(destinations) > MAX_DESTINATIONS:
+        raise ValueError(f"At most {MAX_DESTINATIONS} destinations per Distance Matrix request")
+
+    return {
         "origins": origin,
-        "destinations": destination,
+        "destinations": "|".join(destinations),
         "mode": mode,
-        "units":"imperial",
+        "units": "imperial",
         "key": api_key
     }
 
-    # Make the request
-    response = requests.get(url, params=params)
-
-    # Parse the response
-    if response.status_code == 200:
-        data = response.json()
-        if data["status"] == "OK":
-            result = data["rows"][0]["elements"][0]
-            if result["status"] == "OK":
-                 # Extract and convert distance and duration
-                distance_text = result["distance"]["text"] 
-                duration_text = result["duration"]["text"]  
-
-                # Extract numeric values
-                distance = float(distance_text.split()[0]) 
-                duration = float(duration_text.split()[0]) 
-
-                return distance, duration
-            else:
-                return False
+
+def _parse_distance_matrix(status_code, data, count):
+    if status_code != 200 or data["status"] != "OK":
+        return [False] * count
+
+    results = []
+    for element in data["rows"][0]["elements"]:
+        if element["status"] == "OK":
+            # Use the raw meters/seconds values, the text fields mix units ("1 hour 5 mins")
+            distance = round(element["distance"]["value"] / METERS_PER_MILE, 1)
+            duration = round(element["duration"]["value"] / 60)
+            results.append((distance, duration))
         else:
-            return False
-    else:
-        return False
+            results.append(False)
+    return results
+
+
+def get_distances_google_maps(api_key, origin, destinations, mode="driving"):
+    """
+    Get the distance from one origin to several destinations with a single Distance Matrix request.
+
+    Parameters:
+        api_key (str): Google Maps API key.
+        origin (str): Origin location (latitude,longitude or address).
+        destinations (list of str): Destination locations (latitude,longitude or address), at most 25.
+        mode (str): Travel mode (driving, walking, bicycling, transit).
+
+    Returns:
+        list: One (distance in miles, duration in minutes) tuple per destination,
+              or False for destinations the API could not route to.
+    """
+    if not destinations:
+        return []
+
+    params = _distance_matrix_params(api_key, origin, destinations, mode)
+    response = get_session().get(DISTANCE_MATRIX_URL, params=params)
+    data = response.json() if response.status_code == 200 else None
+    return _parse_distance_matrix(response.status_code, data, len(destinations))
+
+
+async def aget_distances_google_maps(api_key, origin, destinations, mode="driving"):
+    """Async variant of `get_distances_google_maps` using the async HTTP client."""
+    if not destinations:
+        return []
+
+    params = _distance_matrix_params(api_key, origin, destinations, mode)
+    response = await get_async_client().get(DISTANCE_MATRIX_URL, params=params)
+    data = response.json() if response.status_code == 200 else None
+    return _parse_distance_matrix(response.status_code, data, len(destinations))
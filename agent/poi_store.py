@@ -0,0 +1,200 @@
+import os
+import csv
+import json
+import math
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+from agent.map_utils import nearest_k
+
+
+POI_STORE_DB = os.getenv("POI_STORE_DB")
+
+# Search radii in miles tried in turn until enough facilities are found
+SEARCH_RADII = [2, 5, 10, 25, 50]
+MILES_PER_DEGREE = 69.0
+
+# Column names tried in order when importing, matched case-insensitively.
+# Covers the HIFLD hospital and fire station exports and plain name/lat/lng files.
+FIELD_CANDIDATES = {
+    "name": ["name", "facility_name", "facilityname"],
+    "address": ["address", "street", "address1"],
+    "city": ["city"],
+    "state": ["state"],
+    "zip": ["zip", "zipcode", "zip_code"],
+    "lat": ["latitude", "lat", "y"],
+    "lng": ["longitude", "lng", "lon", "long", "x"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pois (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    name TEXT,
+    address TEXT,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pois_category ON pois (category);
+CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree (id, min_lat, max_lat, min_lng, max_lng);
+"""
+
+
+# One connection per database file, shared by all threads under the lock
+_connections = {}
+_lock = threading.Lock()
+
+
+@contextmanager
+def _connect(db_path: str):
+    """Holds the lock on the shared connection to `db_path`, creating its schema on first use."""
+    with _lock:
+        conn = _connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.executescript(SCHEMA)
+            _connections[db_path] = conn
+        yield conn
+
+
+def _field(record: dict, name: str):
+    lowered = {k.lower(): v for k, v in record.items()}
+    for candidate in FIELD_CANDIDATES[name]:
+        value = lowered.get(candidate)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _to_poi(record: dict, geometry: dict = None):
+    if geometry and geometry.get("type") == "Point":
+        lng, lat = geometry["coordinates"][:2]
+    else:
+        lat, lng = _field(record, "lat"), _field(record, "lng")
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+    address = ", ".join(str(part) for part in (
+        _field(record, "address"), _field(record, "city"),
+        " ".join(str(p) for p in (_field(record, "state"), _field(record, "zip")) if p),
+    ) if part)
+    return {"name": _field(record, "name"), "address": address or None, "lat": lat, "lng": lng}
+
+
+def read_file(path: str) -> list:
+    """Reads facilities from a CSV file or a GeoJSON point FeatureCollection."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            pois = [_to_poi(row) for row in csv.DictReader(f)]
+    else:
+        with open(path) as f:
+            features = json.load(f).get("features", [])
+        pois = [_to_poi(feature.get("properties") or {}, feature.get("geometry")) for feature in features]
+    return [poi for poi in pois if poi is not None]
+
+
+def load(path: str, category: str, db_path: str = POI_STORE_DB) -> int:
+    """
+    Imports a facility dataset as `category`, replacing what was loaded for it before.
+
+    Returns the number of facilities imported, rows without usable coordinates are skipped.
+    """
+    pois = read_file(path)
+    with _connect(db_path) as conn, conn:
+        conn.execute("DELETE FROM poi_rtree WHERE id IN (SELECT id FROM pois WHERE category = ?)", (category,))
+        conn.execute("DELETE FROM pois WHERE category = ?", (category,))
+        for poi in pois:
+            cursor = conn.execute(
+                "INSERT INTO pois (category, name, address, lat, lng, source) VALUES (?, ?, ?, ?, ?, ?)",
+                (category, poi["name"], poi["address"], poi["lat"], poi["lng"], os.path.basename(path)),
+            )
+            conn.execute(
+                "INSERT INTO poi_rtree (id, min_lat, max_lat, min_lng, max_lng) VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid, poi["lat"], poi["lat"], poi["lng"], poi["lng"]),
+            )
+    return len(pois)
+
+
+_categories = {}
+
+
+def categories(db_path: str = POI_STORE_DB) -> dict:
+    """Category -> number of stored facilities, empty when no store is configured."""
+    if not db_path or not os.path.exists(db_path):
+        return {}
+    with _connect(db_path) as conn:
+        return dict(conn.execute("SELECT category, COUNT(*) FROM pois GROUP BY category").fetchall())
+
+
+def has_category(category: str, db_path: str = POI_STORE_DB) -> bool:
+    if not db_path or not os.path.exists(db_path):
+        return False
+    # Counted once per version of the database file, a new `load` changes its mtime
+    key = (db_path, os.path.getmtime(db_path))
+    if key not in _categories:
+        _categories[key] = categories(db_path)
+    return _categories[key].get(category, 0) > 0
+
+
+def nearest(latitude: float, longitude: float, category: str, count: int = 5,
+            db_path: str = POI_STORE_DB) -> list:
+    """
+    Nearest stored facilities of a category, closest first, as facility dicts.
+
+    Bounding boxes of growing radius are queried on the R*Tree until `count` facilities
+    are found within the radius, then ranked on straight-line distance.
+    """
+    with _connect(db_path) as conn:
+        for radius in SEARCH_RADII:
+            dlat = radius / MILES_PER_DEGREE
+            dlng = radius / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+            # CROSS JOIN keeps the R*Tree as the outer loop, otherwise SQLite scans by category
+            rows = conn.execute(
+                """
+                SELECT p.name, p.address, p.lat, p.lng FROM poi_rtree r CROSS JOIN pois p ON p.id = r.id
+                WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ? AND p.category = ?
+                """,
+                (latitude - dlat, latitude + dlat, longitude - dlng, longitude + dlng, category),
+            ).fetchall()
+            # Ranked within the radius, the corners of the box are farther than that
+            indices, distances = nearest_k(
+                latitude, longitude, [row["lat"] for row in rows], [row["lng"] for row in rows], count,
+                max_miles=radius,
+            )
+            if len(indices) < count and radius != SEARCH_RADII[-1]:
+                continue
+            return [
+                {
+                    "name": rows[i]["name"],
+                    "address": rows[i]["address"],
+                    "lat": rows[i]["lat"],
+                    "lng": rows[i]["lng"],
+                    "miles": round(float(distance), 1),
+                    "open_now": None,
+                }
+                for i, distance in zip(indices, distances)
+            ]
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local facility (point of interest) store")
+    parser.add_argument("--db", default=POI_STORE_DB, required=POI_STORE_DB is None,
+                        help="SQLite database path (defaults to POI_STORE_DB)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load_parser = subparsers.add_parser("load", help="Import a CSV or GeoJSON facility dataset")
+    load_parser.add_argument("path")
+    load_parser.add_argument("--category", required=True, help="e.g. hospital or fire_station")
+    subparsers.add_parser("status", help="Show the stored facilities per category")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        print(f"Loaded {load(args.path, args.category, args.db)} facilities as '{args.category}' into {args.db}")
+    for category, count in categories(args.db).items():
+        print(f"{category}: {count}")
@@ -0,0 +1,88 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+def _point_in_ring(lng, lat, ring):
+    """Even-odd ray casting of one point against one ring (an (N, 2) array of lng, lat)."""
+    x0, y0 = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    crosses = (y0 > lat) != (y1 > lat)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at_lat = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(crosses & (lng < x_at_lat)) % 2)
+
+
+def _polygons(geometry):
+    """Yields every polygon of a GeoJSON Polygon/MultiPolygon as a list of rings."""
+    if geometry["type"] == "Polygon":
+        yield geometry["coordinates"]
+    elif geometry["type"] == "MultiPolygon":
+        yield from geometry["coordinates"]
+
+
+class PolygonIndex:
+    """
+    In-memory point-in-polygon index over GeoJSON (WGS84) features.
+
+    Polygons are bucketed in a regular lng/lat grid by their bounding box, a lookup
+    only runs exact ray casting against the polygons registered in the point's cell.
+
+    Parameters:
+    ----------
+    features : list of dict
+        GeoJSON features with Polygon or MultiPolygon geometries.
+    cell_size : float
+        Grid cell size in degrees.
+    """
+
+    def __init__(self, features: list, cell_size: float = 0.1):
+        self.cell_size = cell_size
+        self.properties = []
+        self._polygons = []
+        self._bboxes = []
+        self._grid = defaultdict(list)
+
+        for feature in features:
+            if not feature.get("geometry"):
+                continue
+            for rings in _polygons(feature["geometry"]):
+                rings = [np.asarray(ring, dtype=float)[:, :2] for ring in rings if len(ring) >= 3]
+                if not rings:
+                    continue
+                self._add(rings, feature.get("properties") or {})
+
+    def _add(self, rings, properties):
+        idx = len(self._polygons)
+        self._polygons.append(rings)
+        self.properties.append(properties)
+
+        min_lng, min_lat = rings[0].min(axis=0)
+        max_lng, max_lat = rings[0].max(axis=0)
+        self._bboxes.append((min_lng, min_lat, max_lng, max_lat))
+
+        for cx in range(self._cell(min_lng), self._cell(max_lng) + 1):
+            for cy in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                self._grid[(cx, cy)].append(idx)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    def __len__(self):
+        return len(self._polygons)
+
+    def query(self, latitude: float, longitude: float) -> list:
+        """Returns the properties of every polygon containing the point."""
+        matches = []
+        for idx in self._grid.get((self._cell(longitude), self._cell(latitude)), ()):
+            min_lng, min_lat, max_lng, max_lat = self._bboxes[idx]
+            if not (min_lng <= longitude <= max_lng and min_lat <= latitude <= max_lat):
+                continue
+            # Even-odd over all rings, so holes cancel out the outer ring
+            inside = False
+            for ring in self._polygons[idx]:
+                inside ^= _point_in_ring(longitude, latitude, ring)
+            if inside:
+                matches.append(self.properties[idx])
+        return matches
@@ -0,0 +1,139 @@
+import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import location as locations
+from agent import tool as tools
+
+
+# Opt-in: prefetching spends upstream calls on lookups the user may never ask for
+PREFETCH = os.getenv("CRISP_PREFETCH", "0") == "1"
+
+# Shelters fetched by the prefetch, the default of get_nearest_shelter so its call hits the cache
+SHELTER_COUNT = 5
+
+STREET_TYPES = [
+    "st", "street", "ave", "avenue", "rd", "road", "blvd", "boulevard", "dr", "drive", "ln", "lane",
+    "way", "ct", "court", "pl", "place", "hwy", "highway", "pkwy", "parkway", "cir", "circle",
+    "ter", "terrace", "trl", "trail", "loop", "sq", "square",
+]
+
+# Words of a sentence that never are part of a street name
+NON_STREET_WORDS = ["a", "an", "the", "of", "at", "to", "by", "in", "on", "for", "from", "with", "and", "or", "is", "are"]
+
+# House number, up to five words of street name and a street type, e.g. "4202 E Fowler Ave".
+# Bare numbers are not street name words, "2 kids at 4202 E Fowler Ave" starts at 4202
+STREET_PATTERN = re.compile(
+    r"\b\d{1,6}(?:\s+(?!(?:\d+|%s)\b)[A-Za-z0-9.'-]+){0,5}?\s+(?:%s)\b\.?"
+    % ("|".join(NON_STREET_WORDS), "|".join(STREET_TYPES)),
+    re.IGNORECASE,
+)
+# End of the sentence holding the address
+SENTENCE_END = re.compile(r"[?!\n;]|\.(?:\s|$)")
+# What must follow the street type for it to be an address: an optional unit, then a
+# comma and a capitalized city, or a two-letter state code or zip code after an optional city
+ADDRESS_CONTEXT = re.compile(
+    r"^(?:,?\s*(?i:apt|unit|suite|ste|#)\.?\s*[A-Za-z0-9-]+)?"
+    r"(?:\s*,\s*[A-Z][A-Za-z.'-]*(?:\s+[A-Z][A-Za-z.'-]*){0,3}"
+    r"|,?(?:\s+[A-Z][A-Za-z.'-]*){0,3}\s*,?\s*(?:[A-Z]{2}|\d{5}(?:-\d{4})?)\b)"
+)
+# City/state/zip tail, up to the last zip code or two-letter state code
+ADDRESS_TAIL = re.compile(r"^.*\b(?:\d{5}(?:-\d{4})?|[A-Z]{2})\b")
+
+
+def find_address(text: str):
+    """
+    The first street address in a message, None if there is none. The street must be
+    followed by a city, state or zip code:
+
+        "I'm at 4202 E Fowler Ave, Tampa, FL 33620. Am I in a zone?" -> "4202 E Fowler Ave, Tampa, FL 33620"
+        "Is 1600 Main St Apt 4, Houston safe?"                       -> "1600 Main St Apt 4, Houston"
+        "I need 2 bottles of water at the place"                     -> None
+        "I need 2 bottles of water at the place OK"                  -> None
+        "Is 5 way to go?"                                            -> None
+        "Category 4 storm hitting the coast by way, Sarah said"      -> None
+    """
+    text = text or ""
+    for match in STREET_PATTERN.finditer(text):
+        rest = SENTENCE_END.split(text[match.end():], maxsplit=1)[0]
+        context = ADDRESS_CONTEXT.match(rest)
+        if context is None:
+            continue
+        tail = ADDRESS_TAIL.match(rest) or context
+        return (match.group(0) + tail.group(0)).strip(" ,")
+    return None
+
+
+def _warm(location: dict):
+    lookups = [
+        (tools._evacuation_zone, (location,)),
+        (tools._nearest_shelters, (location["lat"], location["lng"], SHELTER_COUNT)),
+    ]
+    if location["state"]:
+        # Fills the alert store too, so county level alert calls are answered from memory
+        lookups.append((tools.get_weather_alerts.func, (location["state"],)))
+    for lookup, args in lookups:
+        _executor.submit(_guarded, lookup, *args)
+
+
+def _guarded(fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"Prefetch of {fn.__name__} failed: {e}")
+
+
+def _run(address: str):
+    location = locations.resolve(address)
+    if location is not None:
+        _warm(location)
+
+
+async def _arun(address: str):
+    location = await locations.aresolve(address)
+    if location is None:
+        return
+    lookups = [
+        tools._aevacuation_zone(location),
+        tools._anearest_shelters(location["lat"], location["lng"], SHELTER_COUNT),
+    ]
+    if location["state"]:
+        lookups.append(tools.get_weather_alerts.coroutine(location["state"]))
+    for result in await asyncio.gather(*lookups, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Prefetch failed: {result}")
+
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+# Running prefetch tasks, referenced so they are not garbage collected mid-flight
+_tasks = set()
+
+
+def prefetch(text: str) -> bool:
+    """
+    Starts the zone, shelter and alert lookups of the address in `text` in the background,
+    while the LLM is still deciding which tools to call. The tool calls then hit the warmed
+    caches, or join the lookups still in flight.
+
+    Runs on the event loop when called from a coroutine (Chainlit), on worker threads
+    otherwise (Flask). Does nothing unless CRISP_PREFETCH=1. Returns True when a prefetch
+    was started.
+    """
+    if not PREFETCH:
+        return False
+    address = find_address(text)
+    if not address:
+        return False
+
+    print(f"Prefetching lookups for {address}")
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _executor.submit(_guarded, _run, address)
+        return True
+
+    task = loop.create_task(_arun(address))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
@@ -0,0 +1,79 @@
+import json
+import time
+
+
+class SSEDecoder:
+    """
+    Decodes a Server-Sent Events stream fed line by line (without line endings).
+    `feed` returns (event, data) once a blank line ends an event, data parsed as JSON.
+    """
+
+    def __init__(self):
+        self._event = "message"
+        self._data = []
+
+    def feed(self, line: str):
+        if not line:
+            if not self._data:
+                return None
+            event, data = self._event, json.loads("\n".join(self._data))
+            self._event, self._data = "message", []
+            return event, data
+        if line.startswith(":"):
+            # Comment, used as keep-alive
+            return None
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            self._event = value
+        elif field == "data":
+            self._data.append(value)
+        return None
+
+
+class RAGAnswer:
+    """
+    Answer assembled from the events of the RAG server's /ask/stream route, as they arrive:
+    `sources`, then `token` events carrying the answer text, then `done` or `error`.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_seconds = None
+        self.parts = []
+        self.sources = []
+        self.error = None
+        self.done = None
+        self._decoder = SSEDecoder()
+
+    def feed(self, line: str):
+        """Feeds one raw line of the stream."""
+        event = self._decoder.feed(line)
+        if event is not None:
+            self.add(*event)
+
+    def add(self, event: str, data: dict):
+        if event == "sources":
+            self.sources = data.get("sources", [])
+        elif event == "token":
+            if self.first_token_seconds is None:
+                self.first_token_seconds = time.perf_counter() - self.started
+                print(f"RAG first token after {self.first_token_seconds:.2f}s")
+            self.parts.append(data.get("text", ""))
+        elif event == "done":
+            self.done = data
+        elif event == "error":
+            self.error = data.get("error", "unknown error")
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def result(self) -> str:
+        if self.error is not None:
+            return f"Request failed: {self.error}"
+        if self.done is None:
+            # The server or the connection dropped mid answer, keep what was received
+            return self.text or "Request failed: the RAG stream ended without an answer"
+        return self.done.get("response") or self.text
@@ -0,0 +1,294 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+
+
+# Read deadline in seconds per upstream, calls that set their own timeout keep it
+SOURCE_DEADLINES = {
+    "https://maps.googleapis.com": 10,
+    "https://services.arcgis.com": 15,
+    "https://services5.arcgis.com": 15,
+    "https://tigerweb.geo.census.gov": 60,
+    "https://www.fema.gov": 20,
+    "https://api.weather.gov": 10,
+    "http://localhost:5015": 120,
+}
+
+# Upstreams whose GET requests may be hedged, read-only APIs where a duplicate call is harmless
+HEDGED_SOURCES = {
+    "https://maps.googleapis.com",
+    "https://services.arcgis.com",
+    "https://services5.arcgis.com",
+    "https://api.weather.gov",
+}
+
+HEDGING = os.getenv("HTTP_HEDGING", "0") == "1"
+# Latency samples needed before the p95 is trusted as hedging delay
+HEDGE_MIN_SAMPLES = 20
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURES", 5))
+RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+
+# Last good responses kept per upstream, served while its circuit is open
+STALE_ENTRIES = 256
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit is open and nothing cached."""
+
+
+class AsyncCircuitOpenError(httpx.TransportError):
+    """`CircuitOpenError` for the async client, caught by the `httpx.HTTPError` handlers."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` failures in a row. Once `reset_timeout` seconds
+    have passed a single probe call is let through (half open): a success closes
+    the circuit, a failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def release(self):
+        """Ends a half-open probe that failed for reasons unrelated to the upstream."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state):
+        old, self.state = self.state, state
+        print(f"Circuit {self.name}: {old} -> {state}")
+
+
+def _is_failure(status_code: int) -> bool:
+    # Client errors are the caller's problem, only overload and server errors count against the upstream
+    return status_code >= 500 or status_code == 429
+
+
+class Upstream:
+    """Circuit breaker, deadline, latency samples and last good responses of one upstream."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.deadline = SOURCE_DEADLINES.get(name)
+        self.hedged = HEDGING and name in HEDGED_SOURCES
+        self.breaker = CircuitBreaker(name)
+        self.latencies = deque(maxlen=200)
+        self.hedges = 0
+        self.stale_served = 0
+        self.calls = 0
+        self.bytes = 0
+        self._stale = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, nbytes: int):
+        """Records one request actually sent upstream and the size of its response body."""
+        with self._lock:
+            self.calls += 1
+            self.bytes += nbytes
+
+    def p95(self):
+        samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._stale[key] = response
+            self._stale.move_to_end(key)
+            while len(self._stale) > STALE_ENTRIES:
+                self._stale.popitem(last=False)
+
+    def _stale_response(self, key):
+        with self._lock:
+            response = self._stale.get(key)
+            if response is not None:
+                self.stale_served += 1
+            return response
+
+    def _before(self, key, error_class):
+        """Returns a stale response to serve instead of calling, or raises, when the circuit is open."""
+        if self.breaker.allow():
+            return None
+        stale = self._stale_response(key) if key else None
+        if stale is not None:
+            return stale
+        raise error_class(f"Circuit for {self.name} is open, not calling it for now")
+
+    def _after(self, key, response, started):
+        if _is_failure(response.status_code):
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        self.latencies.append(time.monotonic() - started)
+        if key and response.status_code == 200:
+            self._remember(key, response)
+
+    def call(self, key, send, hedge: bool = False):
+        """
+        Runs the sync `send()` through the circuit breaker.
+
+        `key` identifies idempotent requests whose last good response may be served
+        while the circuit is open (None disables it), `hedge` allows a second request.
+        """
+        stale = self._before(key, CircuitOpenError)
+        if stale is not None:
+            return stale
+
+        started = time.monotonic()
+        try:
+            response = self._hedged(send) if hedge and self.hedged else send()
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Not the upstream's fault, e.g. a bad URL or a cancelled call
+            self.breaker.release()
+            raise
+        self._after(key, response, started)
+        return response
+
+    def _hedged(self, send):
+        delay = self.p95()
+        if delay is None:
+            return send()
+
+        first = _hedge_executor.submit(send)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        # Slow but maybe alive, race a second request and take whichever answers first
+        self.hedges += 1
+        pending = {first, _hedge_executor.submit(send)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def acall(self, key, send, hedge: bool = False):
+        """Async variant of `call`, `send` returns a new awaitable on every call."""
+        stale = self._before(key, AsyncCircuitOpenError)
+        if stale is not None:
+            return stale
+
+        started = time.monotonic()
+        try:
+            response = await (self._ahedged(send) if hedge and self.hedged else send())
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self._after(key, response, started)
+        return response
+
+    async def _ahedged(self, send):
+        delay = self.p95()
+        if delay is None:
+            return await send()
+
+        first = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        pending = {first, asyncio.ensure_future(send())}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "deadline": self.deadline,
+            "p95": self.p95(),
+            "hedges": self.hedges,
+            "stale_served": self.stale_served,
+            "calls": self.calls,
+            "bytes": self.bytes,
+        }
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream_for(url: str) -> Upstream:
+    """The `Upstream` of a URL, one per scheme and host."""
+    parts = urlsplit(str(url))
+    name = f"{parts.scheme}://{parts.netloc}"
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.setdefault(name, Upstream(name))
+    return upstream
+
+
+def breaker_states() -> dict:
+    """Circuit state, deadline, p95 latency and hedging/stale counters of every upstream called so far."""
+    return {name: upstream.stats() for name, upstream in list(_upstreams.items())}
@@ -0,0 +1,159 @@
+import os
+import math
+import time
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from agent import arcgis
+from agent.map_utils import nearest_k
+
+
+SHELTER_LAYER = "https://services5.arcgis.com/Rvw11bGpzJNE7apK/ArcGIS/rest/services/Warming_Centers_Public_View/FeatureServer/7"
+
+# Attributes used when formatting a shelter, plus the ones driving the refresh
+SHELTER_FIELDS = [
+    "OBJECTID", "ShelterName", "Address", "Address2", "City", "State", "Zip", "Hours",
+    "Phone", "Website", "POD_Status", "AllowsAnimals", "AnimalNotes", "Additional_Info",
+    "Status", "EditDate",
+]
+
+REFRESH_SECONDS = float(os.getenv("SHELTER_REFRESH_SECONDS", 300))
+
+# Grid cell size in degrees for the spatial index
+CELL_SIZE = 0.5
+MILES_PER_DEGREE = 69.0
+
+
+class ShelterSnapshot:
+    """
+    Immutable view of the open shelters: attributes plus array-backed coordinates and a grid index.
+    """
+
+    def __init__(self, records: dict):
+        self.object_ids = list(records)
+        self.attributes = [records[obj_id]["attributes"] for obj_id in self.object_ids]
+        self.latitudes = np.array([records[obj_id]["lat"] for obj_id in self.object_ids], dtype=float)
+        self.longitudes = np.array([records[obj_id]["lng"] for obj_id in self.object_ids], dtype=float)
+
+        grid = defaultdict(list)
+        for i, (lat, lng) in enumerate(zip(self.latitudes, self.longitudes)):
+            grid[(math.floor(lng / CELL_SIZE), math.floor(lat / CELL_SIZE))].append(i)
+        self._grid = {cell: np.array(idx) for cell, idx in grid.items()}
+
+    def __len__(self):
+        return len(self.object_ids)
+
+    def nearest(self, latitude: float, longitude: float, count: int = 5, radius: float = 50) -> list:
+        """Returns up to `count` (attributes, lat, lng, miles) tuples within `radius` miles, closest first."""
+        dlat = radius / MILES_PER_DEGREE
+        dlng = radius / (MILES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+
+        cells = [
+            self._grid[(cx, cy)]
+            for cx in range(math.floor((longitude - dlng) / CELL_SIZE), math.floor((longitude + dlng) / CELL_SIZE) + 1)
+            for cy in range(math.floor((latitude - dlat) / CELL_SIZE), math.floor((latitude + dlat) / CELL_SIZE) + 1)
+            if (cx, cy) in self._grid
+        ]
+        if not cells:
+            return []
+
+        candidates = np.concatenate(cells)
+        order, distances = nearest_k(
+            latitude, longitude, self.latitudes[candidates], self.longitudes[candidates], count, max_miles=radius
+        )
+        return [
+            (self.attributes[i], self.latitudes[i], self.longitudes[i], distance)
+            for i, distance in zip(candidates[order], distances)
+        ]
+
+
+def _fetch_records(where: str = "1=1", object_ids: list = None) -> dict:
+    """Fetches shelter records keyed by OBJECTID, following `exceededTransferLimit`."""
+    params = {}
+    if object_ids:
+        params["objectIds"] = ",".join(str(obj_id) for obj_id in object_ids)
+
+    records = arcgis.query(SHELTER_LAYER, where, SHELTER_FIELDS, return_geometry=True, **params)
+    return {record["attributes"]["OBJECTID"]: record for record in records if "lat" in record}
+
+
+class ShelterMirror:
+    """
+    In-memory mirror of the open shelters, refreshed incrementally by `EditDate`/OBJECTID.
+
+    Every refresh fetches the ids of the open shelters, the records edited since the
+    previous refresh and any open record still missing, then swaps in a new snapshot.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.snapshot = None
+        self.last_refresh = None
+        self._records = {}
+        self._last_edit = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            open_ids = set(arcgis.query_ids(SHELTER_LAYER, "Status = 'Open'"))
+
+            if self._last_edit is None:
+                changed = _fetch_records("Status = 'Open'")
+            else:
+                since = datetime.fromtimestamp(self._last_edit / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                changed = _fetch_records(f"EditDate > TIMESTAMP '{since}'")
+
+            records = {obj_id: rec for obj_id, rec in self._records.items() if obj_id in open_ids}
+            records.update({obj_id: rec for obj_id, rec in changed.items() if obj_id in open_ids})
+
+            missing = sorted(open_ids - records.keys())
+            if missing:
+                records.update(_fetch_records(object_ids=missing))
+
+            edits = [rec["attributes"].get("EditDate") or 0 for rec in records.values()]
+            self._last_edit = max(edits + [self._last_edit or 0]) or None
+            self._records = records
+            self.snapshot = ShelterSnapshot(records)
+            self.last_refresh = time.time()
+
+        print(f"Shelter mirror refreshed: {len(records)} open shelters, {len(changed)} changed")
+
+    def is_fresh(self) -> bool:
+        # Stale after a few missed refreshes, callers should then go back to the live layer
+        return self.snapshot is not None and time.time() - self.last_refresh < 3 * self.refresh_seconds
+
+    def nearest(self, latitude: float, longitude: float, count: int = 5, radius: float = 50):
+        """Nearest open shelters from the mirror, or None when the mirror is not fresh."""
+        if not self.is_fresh():
+            return None
+        return self.snapshot.nearest(latitude, longitude, count, radius)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Shelter mirror refresh failed: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="shelter-mirror", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+shelter_mirror = ShelterMirror()
+
+
+def start_shelter_refresher():
+    """Starts the background refresh of the shared shelter mirror."""
+    shelter_mirror.start()
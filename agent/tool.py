@@ -2,6 +2,7 @@ import os
 import shutil
 import sqlite3
 
+import httpx
 import requests
 import pandas as pd
 import requests
@@ -9,13 +10,25 @@ import requests
 from langchain_core.tools import tool
 import us
 
-from typing import List,Dict
-
-from agent.map_utils import arcgis_to_gmaps, gmaps_to_arcgis, get_distance_google_maps
-from googleplaces import GooglePlaces, types, lang 
+from typing import List,Dict,Tuple,Annotated
+
+from langgraph.prebuilt import InjectedState
+
+from agent.map_utils import nearest_k, get_distances_google_maps, aget_distances_google_maps, MAX_DESTINATIONS
+from agent.evac_zones import find_zones, ZONE_LAYERS, ZONE_FIELDS
+from agent import arcgis
+from agent import boundaries
+from agent import location as locations
+from agent.shelters import shelter_mirror, SHELTER_LAYER, SHELTER_FIELDS
+from agent import fema_mirror
+from agent.fema_mirror import FEMA_DECLARATIONS_URL
+from agent.alerts import alert_store, extract_alerts, filter_by_county, summarize_alerts, parse_since, NWS_ALERTS_URL
+from agent.cache import ToolCache, normalize_value
+from agent.facilities import find_facilities, afind_facilities, normalize_categories
+from agent.clients import get_session, get_async_client, CONNECT_TIMEOUT
+from agent.rag_stream import RAGAnswer
 import requests 
 import json 
-import googlemaps
 
 from dotenv import load_dotenv
 load_dotenv("../.env")
@@ -23,15 +36,201 @@ load_dotenv("../.env")
 
 GOOGLE_MAPS_API_KEY=os.environ['GOOGLE_MAPS_API_KEY']
 
+RAG_URL = "http://localhost:5015/ask"
+# Same query, answer streamed as Server-Sent Events
+RAG_STREAM_URL = RAG_URL + "/stream"
+
+# Number of open shelters fetched from ArcGIS before ranking by straight-line distance
+SHELTER_CANDIDATE_COUNT = 50
+
+INCOMPLETE_ADDRESS = "Incomplete Address! Please provide a Complete Address"
+NO_SHELTERS = "No open shelters found within 50 miles."
+# Sent to the RAG server's streaming route
+RAG_STREAM_HEADERS = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+
+# Messages the tools return instead of raising, never cached
+ERROR_PREFIXES = ("An error occurred", "Failed to retrieve data", "Request failed", "Server returned status")
+
+
+def _failed(error) -> str:
+    print(f"Failed to retrieve data: {error}")
+    return f"Failed to retrieve data: {error}"
+
+
+def _cacheable(result) -> bool:
+    # Location tools return (content, location) pairs
+    if isinstance(result, tuple):
+        result = result[0]
+    return isinstance(result, str) and not result.startswith(ERROR_PREFIXES) and "lookup failed" not in result
+
+
+def _state_key(state):
+    found = us.states.lookup(str(state))
+    return found.abbr if found else state
+
+
+# Identical concurrent calls share one upstream request, results are reused for `ttl` seconds
+# Only the arguments the tools match case-insensitively are normalized, e.g. incidentType
+# and county go verbatim into the OpenFEMA filter
+disaster_cache = ToolCache("get_disaster_declaration", ttl=600, cache_if=_cacheable,
+                           normalizers={"state": normalize_value, "declarationType": normalize_value})
+evacuation_zone_cache = ToolCache("is_in_evacuation_zone", ttl=24 * 3600, maxsize=4096,
+                                  normalizers={"address": normalize_value, "session": locations.cache_key},
+                                  cache_if=_cacheable)
+weather_alerts_cache = ToolCache("get_weather_alerts", ttl=60, normalizers={"state": _state_key, "county": normalize_value},
+                                 cache_if=_cacheable)
+shelter_cache = ToolCache("get_nearest_shelter", ttl=120, maxsize=1024,
+                          normalizers={"address": normalize_value, "session": locations.cache_key}, cache_if=_cacheable)
+power_outage_cache = ToolCache("get_power_outage_map", ttl=3600, cache_if=_cacheable)
+# Keyed by coordinates rather than address, so lookups warmed by agent.prefetch are reused
+# whatever address string the LLM passes
+zone_lookup_cache = ToolCache("evacuation_zone_lookup", ttl=24 * 3600, maxsize=4096,
+                              normalizers={"location": locations.point_key}, cache_if=_cacheable)
+shelter_lookup_cache = ToolCache("shelter_lookup", ttl=120, maxsize=1024, cache_if=_cacheable)
+facilities_cache = ToolCache("get_nearby_facilities", ttl=3600, maxsize=1024,
+                             normalizers={"address": normalize_value, "categories": normalize_value,
+                                          "session": locations.cache_key},
+                             cache_if=_cacheable)
+
+# Only the columns used by _format_disasters are requested
+FEMA_DECLARATION_FIELDS = [
+    "disasterNumber", "femaDeclarationString", "state", "declarationType", "declarationTitle",
+    "incidentType", "declarationDate", "incidentBeginDate", "incidentEndDate", "designatedArea",
+    "ihProgramDeclared", "iaProgramDeclared", "paProgramDeclared", "hmProgramDeclared",
+    "region", "lastRefresh",
+]
+
+# Records per OpenFEMA page, larger limits are fetched with $skip
+FEMA_PAGE_SIZE = 1000
+
+
+def _odata_literal(value: str) -> str:
+    # OData string literals escape a single quote by doubling it
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _declaration_params(state: str, declarationType: str, top: int, skip: int, county: str = None,
+                        incidentType: str = None, startDate: str = None, endDate: str = None,
+                        countyFips: str = None) -> dict:
+    """
+    OData query for the latest declarations of a state and type, filtered and sorted server-side.
+
+    A 3-digit `countyFips` matches the county's own and the statewide ('000') declarations,
+    `county` is a plain name match for counties the local boundaries do not know.
+    """
+    filters = [
+        f"state eq {_odata_literal(state.upper())}",
+        f"declarationType eq {_odata_literal(declarationType.upper())}",
+    ]
+    if countyFips:
+        filters.append(f"(fipsCountyCode eq {_odata_literal(countyFips)} or fipsCountyCode eq '000')")
+    elif county:
+        filters.append(f"contains(designatedArea,{_odata_literal(county)})")
+    if incidentType:
+        filters.append(f"incidentType eq {_odata_literal(incidentType)}")
+    if startDate:
+        filters.append(f"declarationDate ge {_odata_literal(startDate)}")
+    if endDate:
+        filters.append(f"declarationDate le {_odata_literal(fema_mirror.end_of_day(endDate))}")
+
+    params = {
+        "$filter": " and ".join(filters),
+        "$orderby": "declarationDate desc",
+        "$select": ",".join(FEMA_DECLARATION_FIELDS),
+        "$top": top,
+    }
+    if skip:
+        params["$skip"] = skip
+    return params
+
+
+def _declaration_pages(limit: int):
+    """Yields ($top, $skip) for every page needed to collect `limit` records."""
+    for skip in range(0, limit, FEMA_PAGE_SIZE):
+        yield min(FEMA_PAGE_SIZE, limit - skip), skip
+
+
+def _format_disasters(disaster_summaries: list) -> str:
+    """Formats declaration summaries into readable entries, in the order given."""
+    formatted_disasters = []
+    for disaster in disaster_summaries:
+        formatted_disasters.append(
+            f"Disaster ID: {disaster.get('disasterNumber')}\n"
+            f"Declaration String: {disaster.get('femaDeclarationString')}\n"
+            f"State: {disaster.get('state')}\n"
+            f"Declaration Type: {disaster.get('declarationType')}\n"
+            f"Title: {disaster.get('declarationTitle')}\n"
+            f"Incident Type: {disaster.get('incidentType')}\n"
+            f"Declaration Date: {disaster.get('declarationDate')}\n"
+            f"Incident Begin Date: {disaster.get('incidentBeginDate')}\n"
+            f"Incident End Date: {disaster.get('incidentEndDate')}\n"
+            f"Area: {disaster.get('designatedArea')}\n"
+            f"Programs Declared: "
+            f"IH: {disaster.get('ihProgramDeclared')}, "
+            f"IA: {disaster.get('iaProgramDeclared')}, "
+            f"PA: {disaster.get('paProgramDeclared')}, "
+            f"HM: {disaster.get('hmProgramDeclared')}\n"
+            f"Region: {disaster.get('region')}\n"
+            f"Last Refresh: {disaster.get('lastRefresh')}\n"
+        )
+
+    return "".join(f"{disaster}\n" for disaster in formatted_disasters)
+
+
+NO_DECLARATIONS = "No matching disaster declarations found."
+
+
+def _format_mirror_disasters(state: str, declarationType: str, limit: int, filters: dict) -> str:
+    disaster_summaries = fema_mirror.query(state, declarationType, limit, **filters)
+    result = _format_disasters(disaster_summaries) or f"{NO_DECLARATIONS}\n"
+    return f"{result}{fema_mirror.freshness()}"
+
+
+def _declaration_filters(state: str, county: str, incidentType: str, startDate: str, endDate: str) -> dict:
+    filters = dict(incidentType=incidentType, startDate=startDate, endDate=endDate)
+    geoid = boundaries.county_fips(state, county) if county else None
+    if geoid:
+        filters["countyFips"] = geoid[2:]
+    else:
+        filters["county"] = county
+    return filters
+
+
+def _declaration_requests(state: str, declarationType: str, limit: int, county: str, incidentType: str,
+                          startDate: str, endDate: str):
+    """
+    (answer, pages): the answer when the synced mirror has one, else the (params, $top)
+    of every page of the live query.
+    """
+    filters = _declaration_filters(state, county, incidentType, startDate, endDate)
+
+    # The mirror is a local SQLite file, reading it inline is cheaper than a thread hop
+    if fema_mirror.is_available():
+        return _format_mirror_disasters(state, declarationType, limit, filters), None
+
+    return None, [(_declaration_params(state, declarationType, top, skip, **filters), top)
+                  for top, skip in _declaration_pages(limit)]
+
+
+def _declaration_page(response) -> list:
+    response.raise_for_status()  # Raise an exception for bad status codes
+    return response.json().get("DisasterDeclarationsSummaries", [])
+
+
 @tool
+@disaster_cache
 def get_disaster_declaration(state: str,
                              declarationType: str,
-                             limit: int = 10) -> str:
+                             limit: int = 10,
+                             county: str = None,
+                             incidentType: str = None,
+                             startDate: str = None,
+                             endDate: str = None) -> str:
     """
        Retrieves formatted disaster declaration summaries from the OpenFEMA API for a specified state and type.
 
-       Connects to the OpenFEMA Disaster Declarations Summaries API, fetching disaster declarations by state and type,
-       and formats results into readable strings.
+       Connects to the OpenFEMA Disaster Declarations Summaries API, fetching the latest disaster declarations
+       by state and type, and formats results into readable strings.
 
        Parameters:
        ----------
@@ -41,11 +240,18 @@ def get_disaster_declaration(state: str,
            Declaration type, such as "DR" (major disaster) or "EM" (emergency).
        limit : int, optional
            Max number of results (default is 10).
+       county : str, optional
+           County name to restrict the designated area to (e.g., "Harris"). Statewide
+           declarations are included when the county is known to the local boundaries.
+       incidentType : str, optional
+           Incident type such as "Hurricane", "Flood" or "Severe Storm".
+       startDate, endDate : str, optional
+           ISO dates (e.g., "2024-09-01") bounding the declaration date.
 
        Returns:
        -------
        list of str
-           A list of formatted summaries, each containing:
+           A list of formatted summaries, newest declaration first, each containing:
            - Disaster ID, Declaration String, State, Title, Type, Dates, Area, Programs Declared, Region, Last Refresh Date.
            If request fails, returns an error message.
 
@@ -56,74 +262,164 @@ def get_disaster_declaration(state: str,
 
        Notes:
        ------
-       - Uses pagination; `limit` restricts records per call.
-       - Requires `requests` library.
+       - Filtering, ordering and projection run server-side ($filter, $orderby, $select, $top).
+       - Limits above one page are fetched with $skip pagination.
+       - Served from the local SQLite mirror when FEMA_MIRROR_DB has been synced (`python -m agent.fema_mirror sync`).
        """
-    base_url = "https://www.fema.gov/api/open/v2/DisasterDeclarationsSummaries"
+    answer, pages = _declaration_requests(state, declarationType, limit, county, incidentType, startDate, endDate)
+    if answer is not None:
+        return answer
+
+    disaster_summaries = []
+    try:
+        for params, top in pages:
+            page = _declaration_page(get_session().get(FEMA_DECLARATIONS_URL, params=params))
+            disaster_summaries.extend(page)
+            if len(page) < top:
+                break
+    except requests.RequestException as e:
+        return _failed(e)
+
+    return _format_disasters(disaster_summaries) or NO_DECLARATIONS
 
-    # Parameters for the API request
+
+@disaster_cache
+async def _aget_disaster_declaration(state: str,
+                                     declarationType: str,
+                                     limit: int = 10,
+                                     county: str = None,
+                                     incidentType: str = None,
+                                     startDate: str = None,
+                                     endDate: str = None) -> str:
+    answer, pages = _declaration_requests(state, declarationType, limit, county, incidentType, startDate, endDate)
+    if answer is not None:
+        return answer
+
+    disaster_summaries = []
+    try:
+        for params, top in pages:
+            page = _declaration_page(await get_async_client().get(FEMA_DECLARATIONS_URL, params=params))
+            disaster_summaries.extend(page)
+            if len(page) < top:
+                break
+    except httpx.HTTPError as e:
+        return _failed(e)
+
+    return _format_disasters(disaster_summaries) or NO_DECLARATIONS
+
+get_disaster_declaration.coroutine = _aget_disaster_declaration
+
+
+def _zone_query(location: dict):
+    """
+    Builds the live ArcGIS query (layer url, spatial filter params) of the evacuation zone
+    layer of the location's state, None for states without a zone layer.
+    """
+    # Only the zone attributes are fetched, never the zone polygons
     params = {
-        "state": state,                     # Filter by state (e.g., Texas)
-        "declarationType": declarationType, # Declaration type (e.g., DR for major disaster)
+        "geometry": "",  
+        "geometryType": "",  
+        "spatialRel": "",  
+        "inSR": 102100  
     }
 
+    geometry_user_arcgis = (location["x"], location["y"])
+    
+    if location["state"] == "FL":
+        base_url = ZONE_LAYERS["FL"]
+        params["geometry"] = f"{geometry_user_arcgis[0]},{geometry_user_arcgis[1]}"
+        params["geometryType"] = "esriGeometryPoint"
+        params["spatialRel"] = "esriSpatialRelWithin"
+        
+        
+    elif location["state"] == "TX":
+        base_url = ZONE_LAYERS["TX"]
+
+        # Only the zones containing the point, an envelope around it also matched neighbouring zones
+        params["geometry"] = f"{geometry_user_arcgis[0]},{geometry_user_arcgis[1]}"
+        params["geometryType"] = "esriGeometryPoint"
+        params["spatialRel"] = "esriSpatialRelIntersects"
+
+    else:
+        return None
+
+    return base_url, params
+
+
+def _zones_of(records: list) -> set:
+    res_zones = set()
+    for record in records:
+        attributes = record["attributes"]
+        zone = attributes.get("Zone") or attributes.get("EZone")
+        #status = attributes.get("STATUS", '')
+        if zone:
+            res_zones.add(zone)
+    return res_zones
+
+
+def _format_zones(zones: set) -> str:
+    if zones:
+        return f"Your location is in Evacuation Zone(s) {', '.join(sorted(zones))}."
+    return "The location is not within an evacuation zone."
+
+
+def _zone_lookup(location: dict):
+    """(answer, query): the answer when it needs no live query, else the (layer, params) to query."""
+    state = location["state"]
+
+    # Answer from the synced local zone index, the live layers are only a fallback
+    local_zones = find_zones(state, location["lat"], location["lng"])
+    if local_zones is not None:
+        return _format_zones(local_zones), None
+
+    query = _zone_query(location)
+    if query is None:
+        return f"Evacuation zone data is only available for Florida and Texas, not {state}.", None
+    return None, query
+
+
+@zone_lookup_cache
+def _evacuation_zone(location: dict) -> str:
+    answer, query = _zone_lookup(location)
+    if answer is not None:
+        return answer
+
+    layer, params = query
     try:
-        # Make the request
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        # Convert response to JSON
-        data = response.json()
-        disaster_summaries = data.get("DisasterDeclarationsSummaries", [])
-
-        # Format each disaster entry as a string
-        formatted_disasters = []
-        for disaster in disaster_summaries:
-
-            if state== disaster.get('state'):
-                formatted_disasters.append(
-                    [f"Disaster ID: {disaster.get('disasterNumber')}\n"
-                    f"Declaration String: {disaster.get('femaDeclarationString')}\n"
-                    f"State: {disaster.get('state')}\n"
-                    f"Declaration Type: {disaster.get('declarationType')}\n"
-                    f"Title: {disaster.get('declarationTitle')}\n"
-                    f"Incident Type: {disaster.get('incidentType')}\n"
-                    f"Declaration Date: {disaster.get('declarationDate')}\n"
-                    f"Incident Begin Date: {disaster.get('incidentBeginDate')}\n"
-                    f"Incident End Date: {disaster.get('incidentEndDate')}\n"
-                    f"Programs Declared: "
-                    f"IH: {disaster.get('ihProgramDeclared')}, "
-                    f"IA: {disaster.get('iaProgramDeclared')}, "
-                    f"PA: {disaster.get('paProgramDeclared')}, "
-                    f"HM: {disaster.get('hmProgramDeclared')}\n"
-                    f"Region: {disaster.get('region')}\n"
-                    f"Last Refresh: {disaster.get('lastRefresh')}\n"]
-                )
-
-        print(len(formatted_disasters[-limit:]))
-
-        formatted_disasters = formatted_disasters[-limit:]
-
-        result = ""
-
-        for disaster in formatted_disasters:
-            result += f"{disaster[0]}\n"
-
-        return result
-    except requests.RequestException as e:
-        return [f"Failed to retrieve data: {e}"]
+        records = arcgis.query(layer, out_fields=arcgis.available_fields(layer, ZONE_FIELDS), **params)
+    except (requests.RequestException, RuntimeError) as e:
+        return _failed(e)
 
+    return _format_zones(_zones_of(records))
 
-@tool
-def is_in_evacuation_zone(address: str) -> str:
+
+@zone_lookup_cache
+async def _aevacuation_zone(location: dict) -> str:
+    answer, query = _zone_lookup(location)
+    if answer is not None:
+        return answer
+
+    layer, params = query
+    try:
+        records = await arcgis.aquery(layer, out_fields=await arcgis.aavailable_fields(layer, ZONE_FIELDS), **params)
+    except (httpx.HTTPError, RuntimeError) as e:
+        return _failed(e)
+
+    return _format_zones(_zones_of(records))
+
+
+@tool(response_format="content_and_artifact")
+@evacuation_zone_cache
+def is_in_evacuation_zone(address: str = None,
+                          session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
     
     """
     Determines if a given location is within an evacuation zone using state-specific APIs.
 
     Parameters:
     ----------
-    adsress : str
-        Address of the location
+    address : str, optional
+        Address of the location. Leave empty to use the address the user already gave in this conversation.
 
     Returns:
     --------
@@ -133,7 +429,8 @@ def is_in_evacuation_zone(address: str) -> str:
     Notes:
     ------
     - For Florida (FL): Uses a point-based query (`esriGeometryPoint`) to check evacuation zones.
-    - For Texas (TX): Uses a small bounding box (`esriGeometryEnvelope`) with an intersect relationship to approximate point queries.
+    - For Texas (TX): Uses a point-based query (`esriGeometryPoint`) with an intersect relationship.
+    - Both are only queried live when no local zone file has been synced (`python -m agent.evac_zones`).
 
     Example:
     --------
@@ -141,104 +438,56 @@ def is_in_evacuation_zone(address: str) -> str:
     'Your location is in Evacuation Zone(s) A.'
     """
 
-    # Define query parameters
-    params = {
-        "f": "json", 
-        "geometry": "",  
-        "geometryType": "",  
-        "spatialRel": "",  
-        "outFields": "*",  
-        "where": "1=1", 
-        "defaultSR": 102100  
-    }
+    # Follow-up questions reuse the location resolved earlier in the conversation
+    location = locations.resolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
 
-    # TODO Decode location
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    geocode_result = gmaps.geocode(address)
+    return _evacuation_zone(location), location
 
-    if geocode_result:
 
-        latitude = geocode_result[0]['geometry']['location']['lat']
-        longitude = geocode_result[0]['geometry']['location']['lng']
+@evacuation_zone_cache
+async def _ais_in_evacuation_zone(address: str = None,
+                                  session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
+    location = await locations.aresolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
 
-        place_geocoded = gmaps.reverse_geocode((latitude, longitude))
+    return await _aevacuation_zone(location), location
 
-        for comp in place_geocoded[0]['address_components']:
-            if 'administrative_area_level_1' in comp['types']:
-                break
+is_in_evacuation_zone.coroutine = _ais_in_evacuation_zone
 
-        state = comp['short_name']
+def _format_alerts(alerts: list, state_abbr: str, county: str = None) -> str:
+    place = f"{county}, {state_abbr}" if county else state_abbr
+    if county:
+        alerts = filter_by_county(alerts, county, boundaries.county_fips(state_abbr, county))
+    if not alerts:
+        return f"No active alerts for {place}."
+    return summarize_alerts(alerts, f"Active weather alerts for {place}")
 
-        geometry_user_arcgis = (gmaps_to_arcgis(latitude, longitude))
-        
-        if state == "FL":
-            base_url = "https://services.arcgis.com/3wFbqsFPLeKqOlIK/arcgis/rest/services/KYZ_ZL_Vector_Enriched_Calculated_20230608/FeatureServer/28/query"
-            params["geometry"] = f"{geometry_user_arcgis[0]},{geometry_user_arcgis[1]}"
-            params["geometryType"] = "esriGeometryPoint"
-            params["spatialRel"] = "esriSpatialRelWithin"
-            
-            
-        elif state == "TX":
-            base_url = "https://services.arcgis.com/su8ic9KbA7PYVxPS/arcgis/rest/services/HurricaneEvac_Zones/FeatureServer/0/query"
-
-            offset = 10000  
-
-            xmin = geometry_user_arcgis[0] - offset
-            ymin = geometry_user_arcgis[1] - offset
-            xmax = geometry_user_arcgis[0] + offset
-            ymax = geometry_user_arcgis[1] + offset
-
-            params["geometry"] = f"{xmin},{ymin},{xmax},{ymax}"
-            params["geometryType"] = "esriGeometryEnvelope"
-            params["spatialRel"] = "esriSpatialRelIntersects"
-
-        # Make the request
-        response = requests.get(base_url, params=params)
-        # Check if the request was successful
-        if response.status_code == 200:
-            data = response.json()
-            zone_features = data.get("features", [])
-
-            if zone_features:
-                res_zones = set()
-                for feature in zone_features:
-                    attributes = feature["attributes"]
-                    zone = attributes.get("Zone") or attributes.get("EZone")
-                    #status = attributes.get("STATUS", '')
-                    res_zones.add(zone)
-
-                return f"Your location is in Evacuation Zone(s) {zone}."
-            else:
-                return "The location is not within an evacuation zone."
-
-    print(f"Failed to retrieve data: {response.status_code}")
-    
-    return f"Failed to retrieve data: {response.status_code}"
 
-def extract_alerts(data):
-    alerts = []
-    
-    for feature in data.get('features', []):
-        properties = feature.get('properties', {})
-        
-        alert = {
-            "Event": properties.get("event"),
-            "Affected Areas": properties.get("areaDesc"),
-            "Severity": properties.get("severity"),
-            "Certainty": properties.get("certainty"),
-            "Urgency": properties.get("urgency"),
-            "Start Time": properties.get("onset"),
-            "End Time": properties.get("ends"),
-            "Headline": properties.get("headline"),
-            "Description": properties.get("description"),
-            "Instructions": properties.get("instruction"),
-            "Source": properties.get("senderName")
-        }
-        alerts.append(alert)
-    
-    return alerts
+def _alerts_lookup(state: str, county: str = None):
+    """(answer, state_abbr): the answer when it needs no request, else the state to fetch."""
+    state = us.states.lookup(state)
+    if not state:
+        return "A state by this name doesn't exist in USA", None
+    state_abbr = state.abbr.upper()
+
+    # Polled in the background, answering from the store costs no request
+    if alert_store.is_fresh(state_abbr):
+        return _format_alerts(alert_store.alerts(state_abbr), state_abbr, county), None
+    return None, state_abbr
+
+
+def _alerts_answer(response, state_abbr: str, county: str = None) -> str:
+    response.raise_for_status()  # Check for HTTP errors
+    alerts_data = response.json()
+    alert_store.update(state_abbr, alerts_data)
+    return _format_alerts(extract_alerts(alerts_data), state_abbr, county)
+
 @tool
-def get_weather_alerts(state:str) -> Dict:
+@weather_alerts_cache
+def get_weather_alerts(state:str, county: str = None) -> str:
     """
     Fetches active weather alerts for a given U.S. state using the National Weather Service (NWS) API.
 
@@ -246,68 +495,248 @@ def get_weather_alerts(state:str) -> Dict:
     details of any alerts that are currently in effect. The state is identified by its two-letter 
     abbreviation or its full name (e.g., 'FL', 'Florida', 'NY', 'New York').
 
+    Near-identical alerts issued for many counties are merged into one entry listing all
+    affected areas, and entries are ordered by severity and urgency. The summary is kept
+    within ALERT_TOKEN_BUDGET tokens, lower priority entries are dropped first.
+
     Parameters:
     state (str): The name or two-letter abbreviation of the state for which to fetch weather alerts. 
                  Example: 'FL' for Florida, 'CA' for California.
+    county (str, optional): Only return alerts covering this county, e.g. 'Hillsborough'.
 
     Returns:
-    dict: A list of active weather alerts for the state in the form of a dictionary. 
-          Each alert contains details like the event type, description, and affected areas.
-    
-    Returns:
-    str: If no active alerts are found, returns a message indicating that there are no alerts 
-         for the specified state.
+    str: A summary of the active alerts with event, severity, affected areas, times, description
+         and instructions, or a message indicating that there are no alerts for the state.
     
     Example:
     >>> get_weather_alerts('FL')
+    >>> get_weather_alerts('FL', county='Pinellas')
+    """
+
+    answer, state_abbr = _alerts_lookup(state, county)
+    if answer is not None:
+        return answer
+
+    try:
+        return _alerts_answer(get_session().get(NWS_ALERTS_URL, params={"area": state_abbr}), state_abbr, county)
+    except requests.exceptions.RequestException as e:
+        return f"An error occurred: {e}"
+
+
+@weather_alerts_cache
+async def _aget_weather_alerts(state: str, county: str = None) -> str:
+    answer, state_abbr = _alerts_lookup(state, county)
+    if answer is not None:
+        return answer
+
+    try:
+        return _alerts_answer(await get_async_client().get(NWS_ALERTS_URL, params={"area": state_abbr}), state_abbr, county)
+    except httpx.HTTPError as e:
+        return f"An error occurred: {e}"
+
+get_weather_alerts.coroutine = _aget_weather_alerts
+
+
+@tool
+def get_weather_alert_changes(state: str, since: str) -> str:
     """
+    Lists the weather alerts of a U.S. state that are new, updated or expired since a given time.
+
+    Use it for follow-up questions like "what changed since I last asked?".
+
+    Parameters:
+    state (str): The name or two-letter abbreviation of the state, e.g. 'FL'.
+    since (str): ISO 8601 timestamp, e.g. '2024-10-09T14:00:00Z' (UTC if no offset is given).
 
-    # TODO: Reduce the returned answers to < 15K tokens
+    Returns:
+    str: The new, updated and expired alerts, or a message that nothing changed.
 
+    Example:
+    >>> get_weather_alert_changes('FL', '2024-10-09T14:00:00Z')
+    """
     state = us.states.lookup(state)
-    if state:
-        url = f"https://api.weather.gov/alerts/active?area={state.abbr.upper()}"
+    if not state:
+        return "A state by this name doesn't exist in USA"
+    state_abbr = state.abbr.upper()
+
+    try:
+        since_ts = parse_since(since)
+    except ValueError:
+        return f"Could not parse '{since}', use an ISO 8601 timestamp like 2024-10-09T14:00:00Z."
+
+    if alert_store.updated_at(state_abbr) is None:
+        return f"Alerts for {state_abbr} are not being tracked yet, use get_weather_alerts instead."
+
+    changes = alert_store.changes_since(state_abbr, since_ts)
+    sections = []
+    for kind in ("new", "updated", "expired"):
+        for alert in changes[kind]:
+            sections.append(f"[{kind.upper()}] {alert['Headline'] or alert['Event']} ({alert['Affected Areas']})")
+
+    if not sections:
+        return f"No alert changes for {state_abbr} since {since}."
+    return f"Alert changes for {state_abbr} since {since}:\n" + "\n".join(sections)
+
+
+async def _aget_weather_alert_changes(state: str, since: str) -> str:
+    # Served from the in-memory store only
+    return get_weather_alert_changes.func(state, since)
+
+get_weather_alert_changes.coroutine = _aget_weather_alert_changes
+
+def _format_shelter(attributes: dict, dist_dur) -> str:
+    """Formats one shelter feature and its (miles, minutes) distance as a single line."""
+    address = " ".join([attributes[add] for add in ['Address', 'Address2', 'City', 'State', 'Zip'] if attributes.get(add)])
+
+    fields = [
+        f"Name: {attributes['ShelterName']}",
+        f"{address}",
+        f"Distance: {dist_dur[0]} miles - {dist_dur[1]} min",
+        f"{attributes.get('Hours').replace('day','')}" if attributes.get('Hours') else None,
+        f"Contact: {attributes.get('Phone')}, {attributes.get('Website')}"
+        if attributes.get('Phone') and attributes.get('Website')
+        else f"Contact: {attributes.get('Phone')}"
+        if attributes.get('Phone')
+        else f"Website: {attributes.get('Website')}"
+        if attributes.get('Website')
+        else None,
+        f"POD Status: {attributes.get('POD_Status')}" if attributes.get('POD_Status') else None,
+        f"Animals: {attributes.get('AllowsAnimals')},{attributes.get('AnimalNotes')}"
+        if attributes.get('AllowsAnimals') and attributes.get('AnimalNotes')
+        else f"Animals: {attributes.get('AllowsAnimals')}"
+        if attributes.get('AllowsAnimals')
+        else f"Animals: {attributes.get('AnimalNotes')}"
+        if attributes.get('AnimalNotes')
+        else None,
+        f"Additional Info: {attributes.get('Additional_Info')}" if attributes.get('Additional_Info') else None,
+    ]
+
+    return " | ".join([field for field in fields if field])
+
+def _shelter_candidates(latitude: float, longitude: float, records: list, resCount: int) -> list:
+    """Ranks ArcGIS shelter records on straight-line distance, returns the top (attributes, lat, lng) tuples."""
+    records = [record for record in records if "lat" in record]
+    if not records:
+        return []
+
+    # Rank on straight-line distance first, only the top candidates are routed
+    top, _ = nearest_k(latitude, longitude,
+                       [record['lat'] for record in records], [record['lng'] for record in records],
+                       min(resCount, MAX_DESTINATIONS))
+    return [(records[i]['attributes'], records[i]['lat'], records[i]['lng']) for i in top]
+
+
+def _mirror_shelter_candidates(latitude: float, longitude: float, resCount: int):
+    """Candidates from the background shelter mirror, None unless it is fresh."""
+    nearby = shelter_mirror.nearest(latitude, longitude, count=min(resCount, MAX_DESTINATIONS), radius=50)
+    if nearby is None:
+        return None
+    return [(attributes, lat, lng) for attributes, lat, lng, _ in nearby]
+
+
+def _shelter_query(latitude: float, longitude: float, resCount: int) -> dict:
+    """Keyword arguments of the `queryTopFeatures` call for open shelters within 50 miles."""
+    return {
+        "where": "Status = 'Open'", 
+        "out_fields": SHELTER_FIELDS,
+        "return_geometry": True,
+        "operation": "queryTopFeatures",
+        "paginate": False,
+        "topFilter": json.dumps({
+            "groupByFields": "ShelterName",
+            "topCount": resCount,
+            "orderByFields": "ShelterName",
+        }),
+        "geometry": f"{longitude},{latitude}",  
+        "geometryType": "esriGeometryPoint", 
+        "inSR": 4326,
+        "spatialRel": "esriSpatialRelIntersects",  
+        "distance": 50,  
+        "units": "esriSRUnit_StatuteMile",  
+        # Fetch a wider candidate pool, it is narrowed down locally before routing
+        "resultRecordCount": max(resCount, SHELTER_CANDIDATE_COUNT),
+    }
+
+
+def _format_routed_shelters(candidates: list, dist_durs: list) -> str:
+    """Joins Distance Matrix results back to the candidates by OBJECTID, closest driving distance first."""
+    if not any(dist_durs):
+        # A failed Distance Matrix call, not a lack of shelters
+        return "Failed to retrieve data: no driving route to any shelter from the Distance Matrix API."
+
+    features_by_id = {attributes['OBJECTID']: attributes for attributes, _, _ in candidates}
+    distance_dict = {attributes['OBJECTID']: dist_dur
+                     for (attributes, _, _), dist_dur in zip(candidates, dist_durs) if dist_dur}
+
+    return "\n".join(_format_shelter(features_by_id[obj_id], dist_dur)
+                     for obj_id, dist_dur in sorted(distance_dict.items(), key=lambda x: x[1][0]))
+
+
+def _route_request(latitude: float, longitude: float, candidates: list) -> dict:
+    """Distance Matrix arguments routing the origin to every (attributes, lat, lng) candidate."""
+    return dict(origin=f"{latitude},{longitude}", destinations=[f"{lat},{lng}" for _, lat, lng in candidates])
+
+
+def _route_shelters(latitude: float, longitude: float, candidates: list) -> str:
+    """
+    Routes the (attributes, lat, lng) candidates with one Distance Matrix request and
+    returns them formatted, closest driving distance first.
+    """
+    if not candidates:
+        return ""
+
+    dist_durs = get_distances_google_maps(GOOGLE_MAPS_API_KEY, **_route_request(latitude, longitude, candidates))
+    return _format_routed_shelters(candidates, dist_durs)
+
+
+async def _aroute_shelters(latitude: float, longitude: float, candidates: list) -> str:
+    if not candidates:
+        return ""
+
+    dist_durs = await aget_distances_google_maps(GOOGLE_MAPS_API_KEY, **_route_request(latitude, longitude, candidates))
+    return _format_routed_shelters(candidates, dist_durs)
+
+
+@shelter_lookup_cache
+def _nearest_shelters(latitude: float, longitude: float, resCount: int) -> str:
+    candidates = _mirror_shelter_candidates(latitude, longitude, resCount)
+    if candidates is None:
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Check for HTTP errors
-            
-            alerts_data = response.json()
-
-            # Check if there are any alerts
-            if alerts_data.get("features"):
-                alerts = extract_alerts(alerts_data)
-                for alert in alerts:
-                    print(f"Event: {alert['Event']}")
-                    print(f"Affected Areas: {alert['Affected Areas']}")
-                    print(f"Severity: {alert['Severity']}")
-                    print(f"Certainty: {alert['Certainty']}")
-                    print(f"Urgency: {alert['Urgency']}")
-                    print(f"Start Time: {alert['Start Time']}")
-                    print(f"End Time: {alert['End Time']}")
-                    print(f"Headline: {alert['Headline']}")
-                    print(f"Description: {alert['Description']}")
-                    print(f"Instructions: {alert['Instructions']}")
-                    print(f"Source: {alert['Source']}")
-                    print("\n")
-                return f"Above are the current {alerts} for {state.abbr.upper()}. "
-            else:
-                return f"No active alerts for {state.abbr.upper()}."
-
-        except requests.exceptions.RequestException as e:
-            return f"An error occurred: {e}"
-    return "A state by this name doesn't exist in USA"
+            records = arcgis.query(SHELTER_LAYER, **_shelter_query(latitude, longitude, resCount))
+        except (requests.RequestException, RuntimeError) as e:
+            # Never answered as "no shelters", error messages are not cached
+            return _failed(e)
+        candidates = _shelter_candidates(latitude, longitude, records, resCount)
 
-@tool
-def get_nearest_shelter(address: str,
-                    resCount: int = 5) -> str:
+    return _route_shelters(latitude, longitude, candidates) or NO_SHELTERS
+
+
+@shelter_lookup_cache
+async def _anearest_shelters(latitude: float, longitude: float, resCount: int) -> str:
+    candidates = _mirror_shelter_candidates(latitude, longitude, resCount)
+    if candidates is None:
+        try:
+            records = await arcgis.aquery(SHELTER_LAYER, **_shelter_query(latitude, longitude, resCount))
+        except (httpx.HTTPError, RuntimeError) as e:
+            return _failed(e)
+        candidates = _shelter_candidates(latitude, longitude, records, resCount)
+
+    return await _aroute_shelters(latitude, longitude, candidates) or NO_SHELTERS
+
+
+@tool(response_format="content_and_artifact")
+@shelter_cache
+def get_nearest_shelter(address: str = None,
+                    resCount: int = 5,
+                    session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
     
     """
     This function gets the 5 nearest shelters on the basis of the given address. 
 
     Parameters:
     ----------
-    address : str
-        Address of the location
+    address : str, optional
+        Address of the location. Leave empty to use the address the user already gave in this conversation.
 
     Returns:
     --------
@@ -320,95 +749,27 @@ def get_nearest_shelter(address: str,
     'Name: Central Shelter | 123 Main St, City, State'
     """
 
-    # API Endpoint
-    base_url = "https://services5.arcgis.com/Rvw11bGpzJNE7apK/ArcGIS/rest/services/Warming_Centers_Public_View/FeatureServer/7/queryTopFeatures"
-    
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    geocode_result = gmaps.geocode(address)
-
-    if geocode_result:
-
-        latitude = geocode_result[0]['geometry']['location']['lat']
-        longitude = geocode_result[0]['geometry']['location']['lng']
-
-        geometry_user_arcgis = (gmaps_to_arcgis(latitude, longitude))
-
-        params = {
-            "where": "Status = 'Open'", 
-            "topFilter":f"""
-                {{
-                    "groupByFields": "ShelterName",
-                    "topCount": {resCount},
-                    "orderByFields": "ShelterName"
-                }}
-            """,  
-            "geometry": f"{geometry_user_arcgis[0]},{geometry_user_arcgis[1]}",  
-            "geometryType": "esriGeometryPoint", 
-            "spatialRel": "esriSpatialRelIntersects",  
-            "distance": 50,  
-            "units": "esriSRUnit_StatuteMile",  
-            "outFields": "*",  
-            "returnGeometry": "true",  
-            "resultRecordCount": {resCount},  
-            "f": "json"
-        }
-
-        response = requests.get(base_url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-
-            if "features" in data:
-                distance_dict = {}
-                for feature in data["features"]:
-                    attributes = feature['attributes']
-                    geometry_feat_gmaps = arcgis_to_gmaps(feature['geometry']['x'], feature['geometry']['y'])
-                    dist_dur = get_distance_google_maps(GOOGLE_MAPS_API_KEY, origin = f"{latitude},{longitude}", destination=f"{geometry_feat_gmaps[0]},{geometry_feat_gmaps[1]}")
-                    if dist_dur:
-                        distance_dict[attributes['OBJECTID']] = dist_dur
-
-                distance_dict_sorted = dict(sorted(distance_dict.items(), key=lambda x: x[1][0]))
-
-                # Create the result list based on dist_dict's order
-                res = []
-                for obj_id in distance_dict_sorted.keys():
-                    matching_feat = next((feat['attributes'] for feat in list(data["features"]) if feat['attributes']['OBJECTID'] == obj_id), None)
-                    if matching_feat:
-                        address = " ".join([matching_feat[add] for add in ['Address', 'Address2', 'City', 'State', 'Zip'] if matching_feat[add]])
-                        
-                        fields = [
-                            f"Name: {matching_feat['ShelterName']}",
-                            f"{address}",
-                            f"Distance: {distance_dict_sorted[obj_id][0]} miles - {distance_dict_sorted[obj_id][1]} min",
-                            f"{matching_feat.get('Hours').replace('day','')}" if matching_feat.get('Hours') else None,
-                            f"Contact: {matching_feat.get('Phone')}, {matching_feat.get('Website')}" 
-                            if matching_feat.get('Phone') and matching_feat.get('Website') 
-                            else f"Contact: {matching_feat.get('Phone')}" 
-                            if matching_feat.get('Phone') 
-                            else f"Website: {matching_feat.get('Website')}" 
-                            if matching_feat.get('Website') 
-                            else None,
-                            f"POD Status: {matching_feat.get('POD_Status')}" if matching_feat.get('POD_Status') else None,
-                            f"Animals: {matching_feat.get('AllowsAnimals')},{matching_feat.get('AnimalNotes')}" 
-                            if matching_feat.get('AllowsAnimals') and matching_feat.get('AnimalNotes') 
-                            else f"Animals: {matching_feat.get('AllowsAnimals')}" 
-                            if matching_feat.get('AllowsAnimals') 
-                            else f"Animals: {matching_feat.get('AnimalNotes')}" 
-                            if matching_feat.get('AnimalNotes')
-                            else None,
-                            f"Additional Info: {matching_feat.get('Additional_Info')}" if matching_feat.get('Additional_Info') else None,
-                        ]
-
-                        output = " | ".join([field for field in fields if field])
-                        res.append(output)
-                if res:
-                    return "\n".join(res)
-    else:
-        f"Failed to retrieve data: {response.status_code}"
+    location = locations.resolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
+
+    return _nearest_shelters(location["lat"], location["lng"], resCount), location
+
+
+@shelter_cache
+async def _aget_nearest_shelter(address: str = None,
+                                resCount: int = 5,
+                                session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
+    location = await locations.aresolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
 
-    return "No open shelters found within 50 miles."
+    return await _anearest_shelters(location["lat"], location["lng"], resCount), location
+
+get_nearest_shelter.coroutine = _aget_nearest_shelter
 
 @tool
+@power_outage_cache
 def get_power_outage_map(state:str):
     """
     Returns a link containing the power outage map for any mentioned state
@@ -435,10 +796,51 @@ def get_power_outage_map(state:str):
         report_outage = "https://www.aeptexas.com/outages/"
         return f"To check outage follow this link {check_outage} and report any outages here: {report_outage}"
 
+
+async def _aget_power_outage_map(state: str):
+    # Static links, no need to hop to a worker thread
+    return get_power_outage_map.func(state)
+
+get_power_outage_map.coroutine = _aget_power_outage_map
+
 # @tool
 # def weather_forecast(city:str,units:str)->Dict:
 #     pass
 
+def _rag_query(message: str, index: str) -> dict:
+    """JSON body of an /ask request."""
+    print(f"QUERY:{message}")
+    print('Quering rag........')
+    return {
+        "q": message,
+        "index": "HurricaneFirstAid",
+        "prompt": "",
+        "top_k": 5,
+        "conversation_history": "",
+    }
+
+
+def _rag_status_error(response) -> str:
+    return f"Server returned status {response.status_code}: {response.text}"
+
+
+def _rag_blocking_answer(response) -> str:
+    if response.status_code == 200:
+        return str(response.json().get("response"))
+    return _rag_status_error(response)
+
+
+def _query_rag_blocking(query_data: dict) -> str:
+    """Answer of the plain /ask route, for RAG servers without /ask/stream."""
+    # Synthesis on the RAG server can take well beyond the default read timeout
+    return _rag_blocking_answer(get_session().post(RAG_URL, json=query_data, timeout=(CONNECT_TIMEOUT, 120)))
+
+
+async def _aquery_rag_blocking(query_data: dict) -> str:
+    return _rag_blocking_answer(await get_async_client().post(RAG_URL, json=query_data,
+                                                              timeout=httpx.Timeout(120, connect=CONNECT_TIMEOUT)))
+
+
 @tool
 def query_rag_system(message: str , index:str) -> dict:
     """
@@ -456,152 +858,157 @@ def query_rag_system(message: str , index:str) -> dict:
     Example: >>
     query_rag_system(message="what should I use as firstaid during a hurricane",index='HurricaneFirstAid')
     """
-    # Define the URL of your RAG Flask server
-    url = "http://localhost:5015/ask"
-    headers = {"Content-Type": "application/json"}
-
-    print(f"QUERY:{message}")
-    index = "HurricaneFirstAid"
-    query_data = {
-        "q": message,
-        "index": index,
-        "prompt": "",
-        "top_k": 5,
-        "conversation_history": "",
-    }
-    print('Quering rag........')
+    query_data = _rag_query(message, index)
     try:
-        response = requests.post(url, json=query_data, headers=headers)
-
-        if response.status_code == 200:
-            result = response.json()
-            answer = str(result.get("response"))
-            return answer
-        else:
-            return str(f"Server returned status {response.status_code}: {response.text}")
-    except requests.RequestException as e:
-        return str(f"Request failed: {str(e)}")
-    
+        # The answer is read as it is synthesized, the timeout only bounds the gap between events
+        with get_session().post(RAG_STREAM_URL, json=query_data, headers=RAG_STREAM_HEADERS, stream=True,
+                                timeout=(CONNECT_TIMEOUT, 120)) as response:
+            if response.status_code == 404:
+                # RAG server predating /ask/stream
+                return _query_rag_blocking(query_data)
+            if response.status_code != 200:
+                return _rag_status_error(response)
+
+            answer = RAGAnswer()
+            # chunk_size=None hands over each event as soon as it arrives
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                answer.feed(line)
+            return answer.result()
+    # ValueError: an event whose data is not JSON
+    except (requests.RequestException, ValueError) as e:
+        return f"Request failed: {e}"
+
+
+async def _aquery_rag_system(message: str, index: str) -> str:
+    query_data = _rag_query(message, index)
+    try:
+        async with get_async_client().stream("POST", RAG_STREAM_URL, json=query_data, headers=RAG_STREAM_HEADERS,
+                                              timeout=httpx.Timeout(120, connect=CONNECT_TIMEOUT)) as response:
+            if response.status_code == 404:
+                return await _aquery_rag_blocking(query_data)
+            if response.status_code != 200:
+                await response.aread()
+                return _rag_status_error(response)
+
+            answer = RAGAnswer()
+            async for line in response.aiter_lines():
+                answer.feed(line)
+            return answer.result()
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Request failed: {e}"
+
+query_rag_system.coroutine = _aquery_rag_system
+
+
+FACILITY_LABELS = {
+    "hospital": "Hospitals",
+    "fire_station": "Fire Stations",
+    "police": "Police Stations",
+    "pharmacy": "Pharmacies",
+    "shelter": "Shelters",
+}
+
+
+def _format_facilities(results: dict) -> str:
+    sections = []
+    for category, facilities in results.items():
+        label = FACILITY_LABELS[category]
+        if isinstance(facilities, Exception):
+            sections.append(f"{label}: lookup failed ({facilities})")
+            continue
+        if not facilities:
+            sections.append(f"{label}: none found nearby")
+            continue
+
+        lines = [f"{label}:"]
+        for facility in facilities:
+            lines.append(f'Place Name : {facility["name"]}\nAddress : {facility["address"] or "Unavailable"}\n'
+                         f'Distance : {facility["miles"]} miles')
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def _facility_categories(categories):
+    try:
+        return normalize_categories(categories), None
+    except ValueError as e:
+        return None, str(e)
 
 
-@tool
-def get_nearest_hospital(address:str):
-    """
-    This Function gets the 10 nearest hospitals for a given address. It expects a well formatted address with street name, city and state as well.
+@tool(response_format="content_and_artifact")
+@facilities_cache
+def get_nearby_facilities(address: str = None, categories: List[str] = None, count: int = 5,
+                          session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
     """
+    Finds the nearest emergency facilities of several kinds around an address in one call.
 
-    result = ""
-    
-    google_places = GooglePlaces(GOOGLE_MAPS_API_KEY)
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    geocode_result = gmaps.geocode(address)
+    Use this for "what's near me" questions instead of calling one lookup per kind.
+    It expects a well formatted address with street name, city and state as well.
 
+    Parameters:
+    address (str, optional): The address to search around. Leave empty to use the address the user
+                             already gave in this conversation.
+    categories (list of str, optional): Any of 'hospital', 'fire_station', 'police', 'pharmacy'
+                                        and 'shelter'. Defaults to all of them.
+    count (int): Number of facilities per category, closest first. Defaults to 5.
+
+    Returns:
+    str: The nearest facilities per category with name, address and straight-line distance.
 
-    print(geocode_result)
+    Example:
+    >>> get_nearby_facilities('4202 E Fowler Ave, Tampa, FL 33620', ['hospital', 'pharmacy'])
+    """
+    categories, error = _facility_categories(categories)
+    if error:
+        return error, None
 
+    location = locations.resolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
 
-    if geocode_result:
+    return _format_facilities(find_facilities(location['lat'], location['lng'], categories, count)), location
 
-        lat = geocode_result[0]['geometry']['location']['lat']
-        lng = geocode_result[0]['geometry']['location']['lng']
 
-        query_result = google_places.nearby_search(
-                # lat_lng ={'lat': 46.1667, 'lng': -1.15},
-                lat_lng ={'lat': lat, 'lng': lng},
-                radius = 5000,
-                # types =[types.TYPE_HOSPITAL] or
-                # [types.TYPE_CAFE] or [type.TYPE_BAR]
-                # or [type.TYPE_CASINO])
-                types =[types.TYPE_HOSPITAL])
+@facilities_cache
+async def _aget_nearby_facilities(address: str = None, categories: List[str] = None, count: int = 5,
+                                  session: Annotated[dict, InjectedState] = None) -> Tuple[str, dict]:
+    categories, error = _facility_categories(categories)
+    if error:
+        return error, None
 
-        # If any attributions related
-        # with search results print them
-        if query_result.has_attributions: 
-            print (query_result.html_attributions)
+    location = await locations.aresolve(address, session)
+    if location is None:
+        return INCOMPLETE_ADDRESS, None
 
-        
-        # Iterate over the search results
-        for place in query_result.places[:5]:
-            
-            print(place)
-            # place.get_details()
-            print (place.name)
-
-            print (place.name)
-            place_geocoded = gmaps.reverse_geocode((place.geo_location['lat'], place.geo_location['lng']))
-            if place_geocoded:
-                result += f'Place Name : {place.name}\nAddress : {place_geocoded[0]["formatted_address"]}\n' #Latitude : {place.geo_location["lat"]}\nLongitude : {place.geo_location["lng"]}
-                print("Address",place_geocoded[0]["formatted_address"])
-            else:
-                result += f'Place Name : {place.name}\nAddress : Unavailable\nLatitude : {place.geo_location["lat"]}\nLongitude : {place.geo_location["lng"]}\n'
-                print("Address Unvailable")
-            print("Latitude", place.geo_location['lat'])
-            print("Longitude", place.geo_location['lng'])
-            print()
-
-        return result
+    return _format_facilities(await afind_facilities(location['lat'], location['lng'], categories, count)), location
 
-    else:
-        result = "Incomplete Address! Please provide a Complete Address"
-        print("Incomplete Address! Please provide a Complete Address")
-        return result
+get_nearby_facilities.coroutine = _aget_nearby_facilities
 
 
-@tool
-def get_nearest_fire_station(address:str):
+@tool(response_format="content_and_artifact")
+def get_nearest_hospital(address: str = None, session: Annotated[dict, InjectedState] = None):
     """
-    This Function gets the 10 nearest firestations for a given address. It expects a well formatted address with street name, city and state as well.
+    This Function gets the 5 nearest hospitals for a given address. It expects a well formatted address with street name, city and state as well.
+    Leave the address empty to use the address the user already gave in this conversation.
     """
+    return get_nearby_facilities.func(address, ["hospital"], session=session)
 
-    result = ""
-    
-    google_places = GooglePlaces(GOOGLE_MAPS_API_KEY)
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    geocode_result = gmaps.geocode(address)
 
+@tool(response_format="content_and_artifact")
+def get_nearest_fire_station(address: str = None, session: Annotated[dict, InjectedState] = None):
+    """
+    This Function gets the 5 nearest firestations for a given address. It expects a well formatted address with street name, city and state as well.
+    Leave the address empty to use the address the user already gave in this conversation.
+    """
+    return get_nearby_facilities.func(address, ["fire_station"], session=session)
 
-    if geocode_result:
 
-        lat = geocode_result[0]['geometry']['location']['lat']
-        lng = geocode_result[0]['geometry']['location']['lng']
+async def _aget_nearest_hospital(address: str = None, session: Annotated[dict, InjectedState] = None):
+    return await _aget_nearby_facilities(address, ["hospital"], session=session)
 
-        query_result = google_places.nearby_search(
-                # lat_lng ={'lat': 46.1667, 'lng': -1.15},
-                lat_lng ={'lat': lat, 'lng': lng},
-                radius = 5000,
-                # types =[types.TYPE_HOSPITAL] or
-                # [types.TYPE_CAFE] or [type.TYPE_BAR]
-                # or [type.TYPE_CASINO])
-                types =[types.TYPE_FIRE_STATION])
 
-        # If any attributions related
-        # with search results print them
-        if query_result.has_attributions: 
-            print (query_result.html_attributions)
+async def _aget_nearest_fire_station(address: str = None, session: Annotated[dict, InjectedState] = None):
+    return await _aget_nearby_facilities(address, ["fire_station"], session=session)
 
-        
-        # Iterate over the search results
-        for place in query_result.places[:5]:
-            
-            print(place)
-            # place.get_details()
-            print (place.name)
-
-            print (place.name)
-            place_geocoded = gmaps.reverse_geocode((place.geo_location['lat'], place.geo_location['lng']))
-            if place_geocoded:
-                result += f'Place Name : {place.name}\nAddress : {place_geocoded[0]["formatted_address"]}\n' #Latitude : {place.geo_location["lat"]}\nLongitude : {place.geo_location["lng"]}
-                print("Address",place_geocoded[0]["formatted_address"])
-            else:
-                result += f'Place Name : {place.name}\nAddress : Unavailable\nLatitude : {place.geo_location["lat"]}\nLongitude : {place.geo_location["lng"]}\n'
-                print("Address Unvailable")
-            print("Latitude", place.geo_location['lat'])
-            print("Longitude", place.geo_location['lng'])
-            print()
-
-        return result
-
-    else:
-        result = "Incomplete Address! Please provide a Complete Address"
-        print("Incomplete Address! Please provide a Complete Address")
-        return result
+get_nearest_hospital.coroutine = _aget_nearest_hospital
+get_nearest_fire_station.coroutine = _aget_nearest_fire_station
@@ -11,8 +11,11 @@ from langchain_community.llms import OpenAI
 from langchain_openai.chat_models import ChatOpenAI
 from langchain.chains import LLMChain
 
-from agent.tool import get_disaster_declaration,is_in_evacuation_zone,get_weather_alerts,get_power_outage_map,get_nearest_hospital,get_nearest_fire_station, get_nearest_shelter,query_rag_system
+from agent.tool import get_disaster_declaration,is_in_evacuation_zone,get_weather_alerts,get_weather_alert_changes,get_power_outage_map,get_nearest_hospital,get_nearest_fire_station,get_nearby_facilities, get_nearest_shelter,query_rag_system
 from agent.graph import create_graph
+from agent.shelters import start_shelter_refresher
+from agent.alerts import start_alert_poller
+from agent.prefetch import prefetch
 
 import dotenv
 dotenv.load_dotenv()
@@ -21,6 +24,12 @@ dotenv.load_dotenv()
 #def start_flask_server():
 #    subprocess.Popen(["python", "rag/retriever.py"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 #start_flask_server()
+
+# Keep a local mirror of the open shelters so shelter lookups skip ArcGIS
+start_shelter_refresher()
+# Poll NWS alerts in the background so alert questions are answered from memory
+start_alert_poller()
+
 @cl.on_chat_start
 def main():
     llm = ChatOpenAI(
@@ -34,9 +43,11 @@ def main():
     tools = [get_disaster_declaration,
              is_in_evacuation_zone,
              get_weather_alerts,
+             get_weather_alert_changes,
              get_power_outage_map,
              get_nearest_hospital,
              get_nearest_fire_station,
+             get_nearby_facilities,
              get_nearest_shelter,
              query_rag_system]
 
@@ -71,6 +82,8 @@ async def main(message):
     thread_id = cl.user_session.get("thread_id")
 
     question = message.content
+    # Look up the zone, shelters and alerts of a mentioned address while the LLM runs (CRISP_PREFETCH=1)
+    prefetch(question)
 
     config = {
         "configurable": {
@@ -80,8 +93,9 @@ async def main(message):
     }
 
     chat_history.append(HumanMessage(content=question))
-    response = graph.invoke({"messages":chat_history},
-                            config=config)
+    # ainvoke lets the tool node run the native async tools of one turn concurrently
+    response = await graph.ainvoke({"messages":chat_history},
+                                   config=config)
     graph_response = response["messages"][-1].content
     chat_history.append(AIMessage(content=graph_response))
     await cl.Message(graph_response).send()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the vectorized coordinate transforms and distance kernels.
+
+Reports the per-point cost of each kernel for batches of 10, 1k and 100k points,
+next to the old one-point-at-a-time `math` implementation.
+
+    python -m benchmarks.bench_map_utils
+"""
+import math
+import timeit
+
+import numpy as np
+
+from agent.map_utils import web_mercator_to_wgs84, wgs84_to_web_mercator, haversine_miles, nearest_k
+
+
+BATCH_SIZES = [10, 1_000, 100_000]
+
+# Origin in Tampa, candidates spread over Florida
+ORIGIN = (27.9506, -82.4572)
+
+
+def _scalar_arcgis_to_gmaps(x, y):
+    R = 6378137
+    return math.degrees(math.atan(math.sinh(y / R))), (x / R) * (180 / math.pi)
+
+
+def _scalar_haversine(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * 3958.7613 * math.asin(math.sqrt(a))
+
+
+def _time(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def run():
+    rng = np.random.default_rng(0)
+    print(f"{'kernel':<28}{'batch':>10}{'ns/point':>12}")
+
+    for size in BATCH_SIZES:
+        latitudes = rng.uniform(24.5, 31.0, size)
+        longitudes = rng.uniform(-87.6, -80.0, size)
+        x, y = wgs84_to_web_mercator(latitudes, longitudes)
+        xs, ys = x.tolist(), y.tolist()
+        lats, lngs = latitudes.tolist(), longitudes.tolist()
+        number = max(1, 100_000 // size)
+
+        kernels = [
+            ("web_mercator_to_wgs84", lambda: web_mercator_to_wgs84(x, y)),
+            ("  scalar math loop", lambda: [_scalar_arcgis_to_gmaps(a, b) for a, b in zip(xs, ys)]),
+            ("haversine_miles", lambda: haversine_miles(*ORIGIN, latitudes, longitudes)),
+            ("  scalar math loop", lambda: [_scalar_haversine(*ORIGIN, a, b) for a, b in zip(lats, lngs)]),
+            ("nearest_k (k=25)", lambda: nearest_k(*ORIGIN, latitudes, longitudes, 25)),
+        ]
+        for name, fn in kernels:
+            print(f"{name:<28}{size:>10}{_time(fn, number) / size * 1e9:>12.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    run()
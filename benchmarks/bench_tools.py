@@ -0,0 +1,197 @@
+"""
+Tool-level latency benchmark against the local stub server.
+
+Runs every agent tool N times at concurrency 1, 10 and 100 and reports p50/p95/p99
+latency, errors, and the upstream calls and bytes the runs caused, followed by the
+hit counts of the tool and geocode caches over the whole run:
+
+    python -m benchmarks.bench_tools --iterations 100 --latency 80 --jitter 40
+    python -m benchmarks.bench_tools --async --no-cache --json baseline.json
+
+A stub server replaying benchmarks/fixtures is started in-process unless CRISP_STUB_URL
+already points to one. Background mirrors and pollers are not started, so every tool
+goes to its live upstream path.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+ADDRESS = "4202 E Fowler Ave, Tampa, FL 33620"
+
+SCENARIOS = [
+    ("get_disaster_declaration", {"state": "FL", "declarationType": "DR", "limit": 10}),
+    ("get_weather_alerts", {"state": "FL"}),
+    ("is_in_evacuation_zone", {"address": ADDRESS}),
+    ("get_nearest_shelter", {"address": ADDRESS}),
+    ("get_nearby_facilities", {"address": ADDRESS}),
+    ("get_power_outage_map", {"state": "FL"}),
+    ("query_rag_system", {"message": "What should be in a hurricane first aid kit?", "index": "HurricaneFirstAid"}),
+]
+
+CONCURRENCY = [1, 10, 100]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the agent tools against recorded fixtures")
+    parser.add_argument("--iterations", type=int, default=100, help="Calls per tool and concurrency level")
+    parser.add_argument("--concurrency", type=int, action="append", help="Concurrency levels (default 1, 10, 100)")
+    parser.add_argument("--tool", action="append", help="Only benchmark these tools")
+    parser.add_argument("--latency", type=float, default=50.0, help="Stub latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=20.0, help="Stub latency jitter in milliseconds")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Call the async tool variants")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the tool and geocode result caches")
+    parser.add_argument("--json", help="Also write the results to this file")
+    return parser.parse_args()
+
+
+def _percentiles(latencies):
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return round(float(p50), 1), round(float(p95), 1), round(float(p99), 1)
+
+
+def _upstream_totals():
+    from agent.resilience import breaker_states
+    states = breaker_states().values()
+    return sum(s["calls"] for s in states), sum(s["bytes"] for s in states)
+
+
+def _is_error(result) -> bool:
+    from agent.tool import ERROR_PREFIXES
+    return not isinstance(result, str) or result.startswith(ERROR_PREFIXES)
+
+
+def _timed(tool, args):
+    started = time.perf_counter()
+    try:
+        error = _is_error(tool.invoke(args))
+    except Exception:
+        error = True
+    return time.perf_counter() - started, error
+
+
+async def _atimed(tool, args, semaphore):
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            error = _is_error(await tool.ainvoke(args))
+        except Exception:
+            error = True
+        return time.perf_counter() - started, error
+
+
+async def _arun(tool, args, iterations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(_atimed(tool, args, semaphore) for _ in range(iterations)))
+
+
+def _clear_caches():
+    from agent.cache import _caches
+    from agent.geocode import geocode_cache
+    from agent.alerts import alert_store, alert_poller
+    for cache in _caches.values():
+        cache.clear()
+    geocode_cache.clear()
+    # Alerts fetched by an earlier run would otherwise answer from the store, without a request
+    alert_store.clear()
+    alert_poller.clear()
+
+
+def _print_cache_stats(stats: dict):
+    # Geocode hits are split between memory and the SQLite file
+    rows = [(name, row["hits"] + row.get("disk_hits", 0), row["misses"], row.get("coalesced", 0), row["hit_rate"])
+            for name, row in stats.items()]
+    rows = [row for row in rows if sum(row[1:4])]
+    if not rows:
+        return
+    print(f"\n{'cache':<26}{'hits':>10}{'misses':>10}{'coalesced':>10}{'hit rate':>10}")
+    for name, hits, misses, coalesced, hit_rate in rows:
+        print(f"{name:<26}{hits:>10}{misses:>10}{coalesced:>10}{hit_rate:>10.1%}")
+
+
+def run(args):
+    from agent import tool as tools
+    from agent.cache import _caches
+    from agent.geocode import geocode_cache
+
+    if args.no_cache:
+        # Every lookup is a miss, identical concurrent calls are still coalesced
+        for cache in _caches.values():
+            cache.ttl = 0
+        geocode_cache.ttl = 0
+
+    scenarios = [(name, call_args) for name, call_args in SCENARIOS if not args.tool or name in args.tool]
+    results = []
+    print(f"{'tool':<26}{'conc':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'upstream':>10}{'KiB':>10}")
+
+    for name, call_args in scenarios:
+        tool = getattr(tools, name)
+        for concurrency in args.concurrency or CONCURRENCY:
+            _clear_caches()
+            calls_before, bytes_before = _upstream_totals()
+
+            # The tools print their progress, keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                if args.use_async:
+                    timings = asyncio.run(_arun(tool, call_args, args.iterations, concurrency))
+                else:
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        timings = list(executor.map(lambda _: _timed(tool, call_args), range(args.iterations)))
+
+            calls_after, bytes_after = _upstream_totals()
+            p50, p95, p99 = _percentiles([latency for latency, _ in timings])
+            row = {
+                "tool": name,
+                "concurrency": concurrency,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "p99_ms": p99,
+                "errors": sum(error for _, error in timings),
+                "upstream_calls": calls_after - calls_before,
+                "upstream_bytes": bytes_after - bytes_before,
+            }
+            results.append(row)
+            print(f"{name:<26}{concurrency:>6}{p50:>10}{p95:>10}{p99:>10}{row['errors']:>8}"
+                  f"{row['upstream_calls']:>10}{row['upstream_bytes'] / 1024:>10.1f}")
+
+    return results
+
+
+def main():
+    args = _parse_args()
+
+    server = None
+    if not os.getenv("CRISP_STUB_URL"):
+        from benchmarks.stub_server import StubServer
+        server = StubServer(latency=args.latency / 1000, jitter=args.jitter / 1000).start()
+        # Read when agent.clients is imported, so set before importing the tools
+        os.environ["CRISP_STUB_URL"] = server.url
+    # The googlemaps client only checks the key format, the stub never sees it
+    os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIzaStubKeyForBenchmarks")
+
+    try:
+        results = run(args)
+        from agent.cache import cache_stats
+        from agent.geocode import geocode_stats
+        caches = {**cache_stats(), "geocode": geocode_stats()}
+        _print_cache_stats(caches)
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "caches": caches}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
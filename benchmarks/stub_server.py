@@ -0,0 +1,260 @@
+"""
+Local stand-in for the upstream APIs, replaying recorded fixtures with configurable latency.
+
+Requests arrive as /<host>/<path>?<query>, which is where the shared HTTP clients send
+them when CRISP_STUB_URL is set (see agent.clients.stub_url):
+
+    python -m benchmarks.stub_server --port 8765 --latency 80 --jitter 40
+    CRISP_STUB_URL=http://127.0.0.1:8765 chainlit run app.py
+
+A request is answered with the fixture recorded for exactly that request, else with the
+endpoint's default fixture, else 404. Like the real ArcGIS layers, replayed query results
+honour `outFields`, `returnGeometry` and `geometryPrecision`, and bodies are gzipped for
+clients accepting it, so response sizes follow what the client asks for. With --record, requests without an exact fixture
+are forwarded to the real upstream and the response is saved for the next replay.
+"""
+import os
+import gzip
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Query parameters left out of the fixture key, API keys must never end up in fixtures
+IGNORED_PARAMS = {"key"}
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 512
+
+
+def fixture_dir(host: str, path: str, fixtures_dir: str = FIXTURES_DIR) -> str:
+    endpoint = path.strip("/").replace("/", "__") or "_root"
+    return os.path.join(fixtures_dir, host.replace(":", "_"), endpoint)
+
+
+def fixture_key(method: str, query: str, body: bytes) -> str:
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    digest = hashlib.sha1(json.dumps([method, params]).encode() + (body or b""))
+    return digest.hexdigest()[:16]
+
+
+def load_fixture(directory: str, key: str):
+    for name in (f"{key}.json", "default.json"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+    return None
+
+
+def save_fixture(directory: str, key: str, fixture: dict):
+    os.makedirs(directory, exist_ok=True)
+    for name in (f"{key}.json", "default.json"):
+        path = os.path.join(directory, name)
+        # The first recording of an endpoint doubles as its default
+        if name == "default.json" and os.path.exists(path):
+            continue
+        with open(path, "w") as f:
+            json.dump(fixture, f, indent=1)
+
+
+def _round_coordinates(value, digits: int):
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, list):
+        return [_round_coordinates(v, digits) for v in value]
+    if isinstance(value, dict):
+        return {k: _round_coordinates(v, digits) for k, v in value.items()}
+    return value
+
+
+def project_features(body, query: str):
+    """Applies the ArcGIS `outFields`, `returnGeometry` and `geometryPrecision` parameters to a query result."""
+    if not isinstance(body, dict) or not isinstance(body.get("features"), list):
+        return body
+    params = dict(parse_qsl(query))
+    fields = [f for f in params.get("outFields", "*").split(",") if f]
+    keep_geometry = params.get("returnGeometry", "true").lower() != "false"
+    precision = params.get("geometryPrecision")
+
+    features = []
+    for feature in body["features"]:
+        projected = dict(feature)
+        if "*" not in fields and isinstance(feature.get("attributes"), dict):
+            projected["attributes"] = {k: v for k, v in feature["attributes"].items() if k in fields}
+        if not keep_geometry:
+            projected.pop("geometry", None)
+        elif precision and feature.get("geometry"):
+            projected["geometry"] = _round_coordinates(feature["geometry"], int(precision))
+        features.append(projected)
+    return {**body, "features": features}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._serve()
+
+    def do_POST(self):
+        self._serve()
+
+    def _serve(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        path = f"/{path}"
+
+        server.count(host)
+        delay = server.latency_for(host)
+        if delay:
+            time.sleep(delay)
+        if server.error_rate and random.random() < server.error_rate:
+            return self._respond({"status": 503, "headers": {}, "body": {"error": "injected by stub"}})
+
+        directory = fixture_dir(host, path, server.fixtures_dir)
+        key = fixture_key(self.command, parts.query, body)
+        fixture = load_fixture(directory, key)
+        exact = fixture is not None and os.path.exists(os.path.join(directory, f"{key}.json"))
+
+        if server.record and not exact:
+            fixture = self._record(host, path, parts.query, body)
+            save_fixture(directory, key, fixture)
+
+        if fixture is None:
+            fixture = {"status": 404, "headers": {}, "body": {"error": f"no fixture for {host}{path}"}}
+        elif "arcgis" in path.lower():
+            fixture = {**fixture, "body": project_features(fixture["body"], parts.query)}
+        self._respond(fixture)
+
+    def _record(self, host, path, query, body):
+        scheme = "http" if host.startswith(("localhost", "127.0.0.1")) else "https"
+        url = f"{scheme}://{host}{path}" + (f"?{query}" if query else "")
+        headers = {"Content-Type": self.headers["Content-Type"]} if self.headers.get("Content-Type") else {}
+        response = requests.request(self.command, url, data=body or None, headers=headers, timeout=60)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = response.text
+        return {
+            "status": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+            "body": payload,
+        }
+
+    def _respond(self, fixture):
+        body = fixture["body"]
+        data = body.encode() if isinstance(body, str) else json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(fixture["status"])
+        headers = {"Content-Type": "application/json", **fixture.get("headers", {})}
+        # Event streams are never compressed, like the RAG server's /ask/stream
+        compressible = not headers["Content-Type"].startswith("text/event-stream")
+        if compressible and len(data) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Fixture replaying HTTP server.
+
+    Parameters:
+    ----------
+    port : int
+        Port to listen on, 0 picks a free one.
+    latency, jitter : float
+        Added response delay in seconds, uniformly in latency +/- jitter.
+    host_latency : dict, optional
+        Host -> latency in seconds overriding `latency` for that upstream.
+    error_rate : float
+        Fraction of requests answered with a 503 instead of the fixture.
+    record : bool
+        Forward requests without an exact fixture upstream and save the responses.
+    """
+
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 512
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0, host_latency: dict = None,
+                 error_rate: float = 0.0, record: bool = False, fixtures_dir: str = FIXTURES_DIR,
+                 verbose: bool = False):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.host_latency = host_latency or {}
+        self.error_rate = error_rate
+        self.record = record
+        self.fixtures_dir = fixtures_dir
+        self.verbose = verbose
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def latency_for(self, host: str) -> float:
+        latency = self.host_latency.get(host, self.latency)
+        return max(0.0, latency + random.uniform(-self.jitter, self.jitter))
+
+    def count(self, host: str):
+        with self._lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def start(self):
+        """Serves on a background thread, for running in-process next to a benchmark."""
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded upstream responses locally")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter in milliseconds")
+    parser.add_argument("--host-latency", action="append", default=[],
+                        help="Per-upstream latency as HOST=MS, can be repeated")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 503")
+    parser.add_argument("--record", action="store_true", help="Record missing fixtures from the real upstreams")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Fixture directory")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    host_latency = {}
+    for override in args.host_latency:
+        host, ms = override.split("=", 1)
+        host_latency[host] = float(ms) / 1000
+
+    server = StubServer(args.port, args.latency / 1000, args.jitter / 1000, host_latency,
+                        args.error_rate, args.record, args.fixtures, args.verbose)
+    print(f"Stub server on {server.url}, fixtures in {args.fixtures}" + (" (recording)" if args.record else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
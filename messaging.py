@@ -10,8 +10,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from flask import Flask, request
-from agent.tool import get_disaster_declaration,is_in_evacuation_zone,get_weather_alerts,get_power_outage_map, get_nearest_shelter,get_nearest_hospital,get_nearest_fire_station,query_rag_system
+from agent.tool import get_disaster_declaration,is_in_evacuation_zone,get_weather_alerts,get_weather_alert_changes,get_power_outage_map, get_nearest_shelter,get_nearest_hospital,get_nearest_fire_station,get_nearby_facilities,query_rag_system
 from agent.graph import create_graph
+from agent.shelters import start_shelter_refresher
+from agent.alerts import start_alert_poller
+from agent.prefetch import prefetch
+from agent.location import SessionLocations
 
 app = Flask(__name__)
 account_sid = os.environ['ACCOUNT_SID']
@@ -32,9 +36,11 @@ tools = [
     get_disaster_declaration,
     is_in_evacuation_zone,
     get_weather_alerts,
+    get_weather_alert_changes,
     get_power_outage_map,
     get_nearest_hospital,
     get_nearest_fire_station,
+    get_nearby_facilities,
     get_nearest_shelter,
     query_rag_system
 ]
@@ -56,6 +62,15 @@ graph = create_graph(tools=tools,
                         llm=llm,
                         system_prompt=primary_assistant_prompt)
 
+# Keep a local mirror of the open shelters so shelter lookups skip ArcGIS
+start_shelter_refresher()
+# Poll NWS alerts in the background so alert questions are answered from memory
+start_alert_poller()
+
+# Last location resolved for each sender, the only state carried over between their messages.
+# Forgotten after SESSION_IDLE_SECONDS without a message
+sender_locations = SessionLocations()
+
 def send_whatsapp(body:str,to_number:str):
     message = client.messages.create(
     from_=f"whatsapp:{os.environ['TWILIO_WHATSAPP']}",
@@ -70,13 +85,22 @@ def receive_whatsapp():
     from_number = request.form['From']
     body = request.form['Body']
     print(f"Message from {from_number}: {body}")
+    # Look up the zone, shelters and alerts of a mentioned address while the LLM runs (CRISP_PREFETCH=1)
+    prefetch(body)
 
-    # Unique thread ID for each conversation
+    # Unique thread ID for each message, a thread per sender would resend its whole
+    # history to the LLM with every message until it outgrows the context window
     thread_id = str(uuid.uuid4())
 
     # Maintain chat history
     chat_history = []
 
+    # Follow-up questions reuse the sender's address without geocoding it again
+    location = sender_locations.get(from_number)
+    if location:
+        chat_history.append(SystemMessage(content=f"The user's last known address is {location['formatted_address']}. "
+                                                  "Leave the address empty to use it."))
+
     # Add user input to chat history
     chat_history.append(HumanMessage(content=body))
 
@@ -87,8 +111,10 @@ def receive_whatsapp():
         }
     }
 
-    response = graph.invoke({"messages":chat_history},
+    response = graph.invoke({"messages":chat_history, "location": location},
                             config=config)
+    if response.get("location"):
+        sender_locations.set(from_number, response["location"])
     graph_response = response["messages"][-1].content
     chat_history.append(SystemMessage(content=graph_response))
 
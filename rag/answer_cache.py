@@ -0,0 +1,148 @@
+import os
+import time
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _Scope:
+    """Answers cached for one (index, prompt, ...) scope, with their question embeddings as a matrix."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self._matrix = None
+        self._ids = None
+
+    def matrix(self):
+        # Rebuilt only after the entries changed, lookups just take a dot product
+        if self._matrix is None:
+            self._ids = list(self.entries)
+            self._matrix = np.vstack([self.entries[i]["vector"] for i in self._ids]) if self._ids else None
+        return self._ids, self._matrix
+
+    def changed(self):
+        self._matrix = None
+        self._ids = None
+
+
+class AnswerCache:
+    """
+    Semantic cache of synthesized /ask answers.
+
+    A question is answered from the cache when the embedding of a previous question in
+    the same scope has a cosine similarity of at least `threshold` with its own. Scopes
+    are the index plus everything else shaping the answer (prompt, top_k, conversation
+    history), so an answer is never reused under a different prompt or table.
+
+    Parameters:
+    ----------
+    threshold : float
+        Minimum cosine similarity for a hit.
+    ttl : float
+        Seconds an answer stays valid.
+    maxsize : int
+        Max number of answers kept over all scopes, least recently used entries are evicted first.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, maxsize: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._scopes = {}
+        # (scope key, entry id) in least recently used order, over all scopes
+        self._lru = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope_key(index: str, prompt: str = "", top_k: int = 5, conversation_history: str = "") -> tuple:
+        digest = hashlib.sha1(f"{prompt}\0{top_k}\0{conversation_history}".encode()).hexdigest()
+        return index, digest
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, scope_key: tuple, embedding):
+        """The cached answer of the most similar question above the threshold, else None."""
+        vector = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if scope is not None:
+                self._expire(scope_key, scope, now)
+                ids, matrix = scope.matrix()
+                if matrix is not None:
+                    similarities = matrix @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        entry_id = ids[best]
+                        self._lru.move_to_end((scope_key, entry_id))
+                        self.hits += 1
+                        entry = scope.entries[entry_id]
+                        return {**entry["answer"], "similarity": float(similarities[best]), "cached_question": entry["question"]}
+            self.misses += 1
+            return None
+
+    def set(self, scope_key: tuple, question: str, embedding, answer: dict):
+        with self._lock:
+            scope = self._scopes.setdefault(scope_key, _Scope())
+            entry_id = next(self._ids)
+            scope.entries[entry_id] = {
+                "created": time.time(),
+                "question": question,
+                "vector": self._unit(embedding),
+                "answer": answer,
+            }
+            scope.changed()
+            self._lru[(scope_key, entry_id)] = None
+            while len(self._lru) > self.maxsize:
+                (old_key, old_id), _ = self._lru.popitem(last=False)
+                self._remove(old_key, old_id)
+
+    def _expire(self, scope_key, scope, now):
+        expired = [i for i, entry in scope.entries.items() if now - entry["created"] >= self.ttl]
+        for entry_id in expired:
+            self._lru.pop((scope_key, entry_id), None)
+            self._remove(scope_key, entry_id)
+
+    def _remove(self, scope_key, entry_id):
+        scope = self._scopes.get(scope_key)
+        if scope is None:
+            return
+        scope.entries.pop(entry_id, None)
+        scope.changed()
+        if not scope.entries:
+            del self._scopes[scope_key]
+
+    def invalidate(self, index: str = None):
+        """Drops the answers of `index`, e.g. after it was re-indexed, or of every index when None."""
+        with self._lock:
+            for scope_key in [key for key in self._scopes if index is None or key[0] == index]:
+                for entry_id in self._scopes.pop(scope_key).entries:
+                    self._lru.pop((scope_key, entry_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._lru),
+                "threshold": self.threshold,
+            }
+
+
+answer_cache = AnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", 1000)),
+)
@@ -0,0 +1,179 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+
+logger = logging.getLogger("embedding_cache")
+
+
+def normalize_query(text: str) -> str:
+    """Case and whitespace insensitive form of a query, so repeated questions share an entry."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    Query embeddings keyed by (model name, normalized query): an in-memory LRU in front
+    of an optional SQLite table. Embeddings of a given model never change, so entries
+    have no TTL.
+
+    Parameters:
+    ----------
+    maxsize : int
+        Max number of embeddings kept in memory, least recently used entries are evicted first.
+    db_path : str, optional
+        Path of the SQLite file used as the persistent tier. Disabled when None.
+    """
+
+    def __init__(self, maxsize: int = 2048, db_path: str = None):
+        self.maxsize = maxsize
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def get(self, model: str, query: str):
+        key = (model, normalize_query(query))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+                if row:
+                    # Stored as raw float64, loads back exactly as embedded
+                    embedding = array("d", row[0]).tolist()
+                    self._put(key, embedding)
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def set(self, model: str, query: str, embedding: List[float]):
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._put(key, embedding)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+                    (*key, array("d", embedding).tobytes()),
+                )
+                self._db.commit()
+
+    def _put(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embed model wrapper serving repeated query embeddings from a `QueryEmbeddingCache`.
+
+    Only query embeddings are cached, document embeddings go straight to the wrapped
+    model. Cache hits skip the embedding callbacks too, so token counts only include
+    the queries actually sent to the API.
+    """
+
+    embed_model: BaseEmbedding = Field(description="The embed model queries are sent to on a cache miss.")
+    _cache: QueryEmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: QueryEmbeddingCache = None, **kwargs: Any):
+        super().__init__(
+            embed_model=embed_model,
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._cache = cache or QueryEmbeddingCache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> QueryEmbeddingCache:
+        return self._cache
+
+    def get_query_embedding(self, query: str) -> Embedding:
+        embedding = self._cache.get(self.model_name, query)
+        if embedding is None:
+            embedding = super().get_query_embedding(query)
+            self._cache.set(self.model_name, query, embedding)
+        return embedding
+
+    async def aget_query_embedding(self, query: str) -> Embedding:
+        embedding = self._cache.get(self.model_name, query)
+        if embedding is None:
+            embedding = await super().aget_query_embedding(query)
+            self._cache.set(self.model_name, query, embedding)
+        return embedding
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self.embed_model._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self.embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self.embed_model._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self.embed_model._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self.embed_model._aget_text_embeddings(texts)
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", 2048)),
+    db_path=os.getenv("EMBEDDING_CACHE_DB"),
+)
@@ -0,0 +1,168 @@
+import time
+import threading
+import contextlib
+import contextvars
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+
+# Upper bounds in seconds of the stage latency histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RequestMetrics:
+    """Tokens and per-stage seconds of one /ask request."""
+
+    def __init__(self):
+        self.embedding_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.stages = {}
+        self.cached = False
+
+    def as_dict(self) -> dict:
+        return {
+            'total_embedding_token_count': self.embedding_tokens,
+            'prompt_llm_token_count': self.prompt_tokens,
+            'completion_llm_token_count': self.completion_tokens,
+            'total_llm_token_count': self.prompt_tokens + self.completion_tokens,
+            'stage_seconds': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+        }
+
+
+# Metrics of the request being handled, set per request so concurrent requests never share counts
+_current = contextvars.ContextVar("rag_request_metrics", default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per label value."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float):
+        with self._lock:
+            series = self._series.setdefault(label, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self, name: str, label_name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        with self._lock:
+            for label, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{name}_bucket{{{label_name}="{label}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label_name}="{label}",le="+Inf"}} {series["count"]}')
+                lines.append(f'{name}_sum{{{label_name}="{label}"}} {series["sum"]:.6f}')
+                lines.append(f'{name}_count{{{label_name}="{label}"}} {series["count"]}')
+        return lines
+
+
+stage_seconds = Histogram(STAGE_BUCKETS)
+_totals = {"requests": {}, "tokens": {"embedding": 0, "prompt": 0, "completion": 0}}
+_totals_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def request_metrics():
+    """Collects the tokens and stage timings of the request handled inside the block."""
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        stage_seconds.observe("total", time.perf_counter() - started)
+        with _totals_lock:
+            requests = _totals["requests"]
+            requests[metrics.cached] = requests.get(metrics.cached, 0) + 1
+            _totals["tokens"]["embedding"] += metrics.embedding_tokens
+            _totals["tokens"]["prompt"] += metrics.prompt_tokens
+            _totals["tokens"]["completion"] += metrics.completion_tokens
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Times one stage (embed, vector_search, synthesis) of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(name, elapsed)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.stages[name] = metrics.stages.get(name, 0.0) + elapsed
+
+
+class RequestTokenCounter(BaseCallbackHandler):
+    """
+    Token counting callback adding the embedding and LLM tokens of each event to the
+    metrics of the request it runs in, unlike `TokenCountingHandler` whose counts are global.
+    """
+
+    def __init__(self, tokenizer=None):
+        self._token_counter = TokenCounter(tokenizer=tokenizer)
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                       event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload: Optional[Dict[str, Any]] = None,
+                     event_id: str = "", **kwargs: Any) -> None:
+        metrics = _current.get()
+        if metrics is None or payload is None:
+            return
+        if event_type == CBEventType.LLM:
+            counts = get_llm_token_counts(token_counter=self._token_counter, payload=payload, event_id=event_id)
+            metrics.prompt_tokens += counts.prompt_token_count
+            metrics.completion_tokens += counts.completion_token_count
+        elif event_type == CBEventType.EMBEDDING:
+            for chunk in payload.get(EventPayload.CHUNKS, []):
+                metrics.embedding_tokens += self._token_counter.get_string_tokens(chunk)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(self, trace_id: Optional[str] = None, trace_map: Optional[Dict[str, List[str]]] = None) -> None:
+        pass
+
+
+def render(caches: dict = None) -> str:
+    """
+    All metrics in the Prometheus text format. `caches` maps a cache name to its
+    `stats()`, exported as hit/miss counters and a size gauge.
+    """
+    lines = stage_seconds.render("rag_stage_seconds", "stage")
+
+    with _totals_lock:
+        lines.append("# TYPE rag_requests_total counter")
+        for cached, count in sorted(_totals["requests"].items()):
+            lines.append(f'rag_requests_total{{cached="{str(cached).lower()}"}} {count}')
+        lines.append("# TYPE rag_tokens_total counter")
+        for kind, count in _totals["tokens"].items():
+            lines.append(f'rag_tokens_total{{kind="{kind}"}} {count}')
+
+    if caches:
+        lines.append("# TYPE rag_cache_hits_total counter")
+        lines.extend(f'rag_cache_hits_total{{cache="{name}"}} {stats.get("hits", 0) + stats.get("disk_hits", 0)}'
+                     for name, stats in caches.items())
+        lines.append("# TYPE rag_cache_misses_total counter")
+        lines.extend(f'rag_cache_misses_total{{cache="{name}"}} {stats.get("misses", 0)}'
+                     for name, stats in caches.items() if "misses" in stats)
+        lines.append("# TYPE rag_cache_size gauge")
+        lines.extend(f'rag_cache_size{{cache="{name}"}} {stats.get("size", stats.get("engines", 0))}'
+                     for name, stats in caches.items())
+
+    return "\n".join(lines) + "\n"
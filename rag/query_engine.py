@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from llama_index.core.query_engine import CustomQueryEngine
+from llama_index.core.response_synthesizers import BaseSynthesizer
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import QueryBundle
+
+from metrics import stage
+
+
+class RAGQueryEngine(CustomQueryEngine):
+    retriever: BaseRetriever
+    response_synthesizer: BaseSynthesizer
+    # Same template as response_synthesizer, yielding the answer token by token
+    streaming_synthesizer: Optional[BaseSynthesizer] = None
+
+    def custom_query(self, query_str: str, conversation_history: str = "", query_embedding=None):
+        print(f"Executing custom query: '{query_str}' with conversation history: '{conversation_history}'")
+        nodes, rag_retrieved_details = self._retrieve(query_str, query_embedding)
+        if not nodes:
+            # Create a more complete response object with the required methods
+            class Response:
+                def __init__(self):
+                    self.response = "No relevant information found"
+
+                def get_formatted_sources(self):
+                    return []
+
+            response_obj = Response()
+            return response_obj, []
+
+        with stage("synthesis"):
+            response_obj = self.response_synthesizer.synthesize(query_str, nodes, conversation_history=conversation_history)
+        if not response_obj.response:
+            response_obj.response = "No relevant information found."
+
+        return response_obj, rag_retrieved_details
+
+    def stream_query(self, query_str: str, conversation_history: str = "", query_embedding=None):
+        """
+        Retrieves the nodes and returns the synthesis as a stream, without waiting for the completion.
+
+        Returns the StreamingResponse, whose `response_gen` yields the answer as it is
+        generated, and the chunk details. The response is None when nothing was retrieved.
+        """
+        print(f"Executing streaming query: '{query_str}' with conversation history: '{conversation_history}'")
+        nodes, rag_retrieved_details = self._retrieve(query_str, query_embedding)
+        if not nodes:
+            return None, []
+
+        response_obj = self.streaming_synthesizer.synthesize(query_str, nodes, conversation_history=conversation_history)
+        return response_obj, rag_retrieved_details
+
+    def _retrieve(self, query_str: str, query_embedding=None):
+        # With the question already embedded, this stage is the pgvector search alone
+        with stage("vector_search"):
+            nodes = self.retriever.retrieve(QueryBundle(query_str, embedding=query_embedding))
+        if not nodes:
+            logging.warning("No relevant nodes found for the query.")
+            return nodes, []
+
+        i = 0
+        rag_retrieved_details = []
+        logging.info("Retrieved nodes:")
+        for x in nodes:
+            i += 1
+            logging.info(f"Node {i}: {x.get_text()[:100]} (Score: {x.get_score()})")
+            print(f"Metadata for Node {i}: {x.metadata}")
+            docu_info = {
+                'chunk': x.get_text(),
+                'score': x.get_score(),
+                'node_id': x.node_id,
+                'file_name': x.metadata.get('file_name', 'Unknown')
+            }
+            rag_retrieved_details.append(docu_info)
+
+        return nodes, rag_retrieved_details
+
+
+class EngineRegistry:
+    """
+    Query engines keyed by (index, prompt hash, top_k), built once and never mutated,
+    so concurrent requests with different prompts or top_k cannot see each other's settings.
+
+    Engines of the same index share one index object, hence one vector store connection
+    pool. The least recently used engines are dropped beyond `maxsize`, the shared
+    indexes are kept.
+
+    Parameters:
+    ----------
+    build_index : callable
+        index name -> VectorStoreIndex, raises when the vector store is unavailable.
+    build_engine : callable
+        (VectorStoreIndex, prompt, top_k) -> query engine.
+    maxsize : int
+        Max number of engines kept.
+    """
+
+    def __init__(self, build_index, build_engine, maxsize: int = 32):
+        self.build_index = build_index
+        self.build_engine = build_engine
+        self.maxsize = maxsize
+        self._engines = OrderedDict()
+        self._indexes = {}
+        self._lock = threading.Lock()
+        # One lock per key, concurrent first requests for an engine build it once
+        self._build_locks = {}
+        self.hits = 0
+        self.builds = 0
+
+    @staticmethod
+    def key(index: str, prompt: str, top_k: int) -> tuple:
+        return index, hashlib.sha1(prompt.encode()).hexdigest(), top_k
+
+    def _build_lock(self, key):
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def _index(self, name: str):
+        index = self._indexes.get(name)
+        if index is None:
+            with self._build_lock(("index", name)):
+                index = self._indexes.get(name)
+                if index is None:
+                    index = self._indexes[name] = self.build_index(name)
+        return index
+
+    def get(self, index: str, prompt: str = "", top_k: int = 5):
+        key = self.key(index, prompt, top_k)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                self.hits += 1
+                return engine
+
+        with self._build_lock(key):
+            with self._lock:
+                engine = self._engines.get(key)
+                if engine is not None:
+                    # Built by the request this one waited on
+                    self.hits += 1
+            if engine is None:
+                engine = self.build_engine(self._index(index), prompt, top_k)
+                with self._lock:
+                    self.builds += 1
+                    self._engines[key] = engine
+                    while len(self._engines) > self.maxsize:
+                        evicted, _ = self._engines.popitem(last=False)
+                        self._build_locks.pop(evicted, None)
+                print(f"Query engine for '{index}' (top_k={top_k}) built and cached.")
+            return engine
+
+    def prewarm(self, indexes: list, prompt: str = "", top_k: int = 5):
+        """Builds the default engine of each index ahead of the first request, failures are only logged."""
+        for name in indexes:
+            try:
+                self.get(name, prompt, top_k)
+            except Exception as e:
+                logging.error(f"Could not prewarm the query engine for index '{name}': {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engines": len(self._engines),
+                "indexes": len(self._indexes),
+                "hits": self.hits,
+                "builds": self.builds,
+            }
@@ -1,30 +1,45 @@
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+# Before the local imports, the caches read their settings from the environment when imported
+load_dotenv()
+
+from flask import Flask, Response, request, jsonify
 import os
 import sys
+import json
 import logging
 import tiktoken
 from sqlalchemy import make_url
 from llama_index.core import VectorStoreIndex, get_response_synthesizer, Settings, set_global_handler, PromptTemplate
-from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
-from llama_index.core.query_engine import CustomQueryEngine
-from llama_index.core.response_synthesizers import BaseSynthesizer
-from llama_index.core.retrievers import BaseRetriever, VectorIndexRetriever
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.schema import MetadataMode
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
 from llama_index.vector_stores.postgres import PGVectorStore
 import psycopg2
 from indexer import run_indexer 
+from embedding_cache import CachedEmbedding, query_embedding_cache
+from answer_cache import answer_cache
+from query_engine import RAGQueryEngine, EngineRegistry
+import metrics
+from metrics import RequestTokenCounter, request_metrics, stage
 
 
-
-load_dotenv()
-
 sys.stdout.reconfigure(encoding='utf-8')
 
-embed_model = OpenAIEmbedding(model="text-embedding-3-small")
-llm = OpenAI(model="gpt-4o-mini")
+# Tokens are counted per /ask request, see metrics.py
+request_token_counter = RequestTokenCounter(
+    tokenizer=tiktoken.encoding_for_model("gpt-3.5-turbo").encode
+)
+callback_manager = CallbackManager([request_token_counter])
+
+# Repeated questions are embedded once, see embedding_cache.py
+embed_model = CachedEmbedding(
+    OpenAIEmbedding(model="text-embedding-3-small"),
+    cache=query_embedding_cache,
+    callback_manager=callback_manager,
+)
+llm = OpenAI(model="gpt-4o-mini", callback_manager=callback_manager)
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
@@ -32,46 +47,8 @@ logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
 Settings.llm = llm
 Settings.embed_model = embed_model
 Settings.num_output = 2048
+Settings.callback_manager = callback_manager
 
-token_counter = TokenCountingHandler(
-    tokenizer=tiktoken.encoding_for_model("gpt-3.5-turbo").encode
-)
-
-class RAGQueryEngine(CustomQueryEngine):
-    retriever: BaseRetriever
-    response_synthesizer: BaseSynthesizer
-
-    def custom_query(self, query_str: str, conversation_history: str = ""):
-        nodes = self.retriever.retrieve(query_str)
-        if not nodes:
-            logging.warning("No relevant nodes found for the query.")
-            # Create a simple response object with a 'response' attribute.
-            response_obj = type("Response", (object,), {"response": "No relevant information found"})
-            return response_obj, []
-
-
-        i = 0
-        rag_retrieved_details = []
-        logging.info("Retrieved nodes:")
-        for x in nodes:
-            i += 1
-            logging.info(f"Node {i}: {x.get_text()[:100]} (Score: {x.get_score()})")
-            docu_info = {
-                'chunk': x.get_text(),
-                'score': x.get_score(),
-                'node_id': x.node_id,
-                'file_name': x.metadata.get('file_name', 'Unknown')
-            }
-            rag_retrieved_details.append(docu_info)
-
-        response_obj = self.response_synthesizer.synthesize(query_str, nodes, conversation_history=conversation_history)
-        if not response_obj.response:
-            response_obj.response = "No relevant information found."
-
-        return response_obj, rag_retrieved_details
-
-
-query_engines = {}
 DEFAULT_QA_TEMPLATE = (
     "Context information is below.\n"
     "---------------------\n{context_str}\n---------------------\n"
@@ -81,108 +58,127 @@ DEFAULT_QA_TEMPLATE = (
     "Query: {query_str}\nAnswer: "
 )
 
-def get_query_engine_by_index_name(name, prompt='', conversation_history='', top_k=5):
-    print(f"Initializing query engine for index: '{name}'")
+def build_index(name):
+    """VectorStoreIndex over the `rag_<name>` table, shared by all engines of that index."""
     table_name = "rag_" + name
-    print(f"Using table name: {table_name}")
+    url = make_url(os.getenv("VECTOR_DATABASE_URL"))
+    print(f"Connecting to vector store table {table_name} on {url.host}:{url.port}/{url.database} as {url.username}")
+
+    vector_store = PGVectorStore.from_params(
+        database=url.database,
+        host=url.host,
+        password=url.password,
+        port=url.port,
+        user=url.username,
+        table_name=table_name,
+        embed_dim=1536,
+    )
+    return VectorStoreIndex.from_vector_store(vector_store=vector_store)
+
+
+def build_engine(index, prompt, top_k):
+    text_qa_template = PromptTemplate(DEFAULT_QA_TEMPLATE + prompt)
+    return RAGQueryEngine(
+        retriever=VectorIndexRetriever(
+            index=index,
+            similarity_top_k=top_k,
+        ),
+        response_synthesizer=get_response_synthesizer(
+            text_qa_template=text_qa_template,
+            response_mode="compact"
+        ),
+        streaming_synthesizer=get_response_synthesizer(
+            text_qa_template=text_qa_template,
+            response_mode="compact",
+            streaming=True,
+        ),
+    )
+
+
+engine_registry = EngineRegistry(build_index, build_engine, maxsize=int(os.getenv("ENGINE_CACHE_SIZE", 32)))
 
-    if name not in query_engines:
-        url = make_url(os.getenv("VECTOR_DATABASE_URL"))
+
+def get_query_engine_by_index_name(name, prompt='', conversation_history='', top_k=5):
+    """Engine for this index, prompt and top_k from the registry, None when its vector store is unavailable."""
+    try:
+        return engine_registry.get(name, prompt, top_k)
+    except Exception as e:
+        logging.error(f"Error initializing query engine for index '{name}': {e}")
+        return None
+
+
+# Indexes whose engines are built at startup, comma separated
+PREWARM_INDEXES = [name.strip() for name in os.getenv("RAG_PREWARM_INDEXES", "").split(",") if name.strip()]
+engine_registry.prewarm(PREWARM_INDEXES)
+
+app = Flask(__name__)
+
+def sse(event, data):
+    """One Server-Sent Event, data JSON encoded so newlines in the answer cannot split it."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_answer(question, index, prompt, top_k, conversation_history):
+    """
+    SSE events of an /ask request: `sources` as soon as the chunks are retrieved, the
+    answer as `token` events while it is synthesized, then `done` with the token counts
+    and stage timings. Failures after the stream started are sent as an `error` event.
+    """
+    with request_metrics() as current:
         try:
-            print("Connecting to vector store with URL parameters:")
-            print(f"Database: {url.database}, Host: {url.host}, User: {url.username}, Port: {url.port}")
-            
-            vector_store = PGVectorStore.from_params(
-                database=url.database,
-                host=url.host,
-                password=url.password,
-                port=url.port,
-                user=url.username,
-                table_name=table_name,
-                embed_dim=1536,
-            )
-            print("Vector store initialized successfully.")
+            scope = answer_cache.scope_key(index, prompt, top_k, conversation_history)
+            with stage("embed"):
+                question_embedding = embed_model.get_query_embedding(question)
+            cached = answer_cache.get(scope, question_embedding)
+            if cached is not None:
+                current.cached = True
+                print(f"Answered from cache, similar to: '{cached['cached_question']}' ({cached['similarity']:.3f})")
+                yield sse("sources", {
+                    'sources': cached['sources'],
+                    'rag_chunk_details': cached['rag_chunk_details'],
+                    'cached': True,
+                })
+                yield sse("token", {'text': cached['response']})
+                yield sse("done", {'response': cached['response'], 'cached': True, **current.as_dict()})
+                return
+
+            query_engine = get_query_engine_by_index_name(index, prompt, conversation_history, top_k)
+            if query_engine is None:
+                yield sse("error", {"error": "Failed to initialize query engine for the given index."})
+                return
+
+            response, rag_chunk_details = query_engine.stream_query(question, conversation_history, question_embedding)
+            if response is None:
+                yield sse("sources", {'sources': [], 'rag_chunk_details': [], 'cached': False})
+                yield sse("token", {'text': "No relevant information found."})
+                yield sse("done", {'response': "No relevant information found.", 'cached': False, **current.as_dict()})
+                return
+
+            sources = response.get_formatted_sources()
+            yield sse("sources", {'sources': sources, 'rag_chunk_details': rag_chunk_details, 'cached': False})
+
+            parts = []
+            with stage("synthesis"):
+                for text in response.response_gen:
+                    parts.append(text)
+                    yield sse("token", {'text': text})
+            answer = "".join(parts) or "No relevant information found."
+            print("Response:", answer)
+
+            if parts:
+                answer_cache.set(scope, question, question_embedding, {
+                    'response': answer,
+                    'sources': sources,
+                    'rag_chunk_details': rag_chunk_details,
+                })
+            yield sse("done", {'response': answer, 'cached': False, **current.as_dict()})
         except Exception as e:
-            logging.error(f"Error initializing vector store for index '{name}': {e}")
-            return None
-
-        if prompt == '':
-            prompt = DEFAULT_QA_TEMPLATE
-        else:
-            prompt = DEFAULT_QA_TEMPLATE + prompt
-
-        index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-        print("VectorStoreIndex created successfully.")
-
-        text_qa_template = PromptTemplate(prompt)
-        query_engine = RAGQueryEngine(
-            retriever=VectorIndexRetriever(
-                index=index,
-                similarity_top_k=top_k,
-            ),
-            response_synthesizer=get_response_synthesizer(
-                text_qa_template=text_qa_template,
-                response_mode="compact"
-            ),
-        )
-        query_engines[name] = query_engine
-        print(f"Query engine for '{name}' added to cache.")
-    else:
-        print(f"Using cached query engine for index: '{name}'")
-        if prompt != '':
-            query_engines[name].response_synthesizer = get_response_synthesizer(
-                text_qa_template=PromptTemplate(prompt),
-                response_mode="compact"
-            )
-        query_engines[name].retriever.similarity_top_k = top_k
-
-    return query_engines[name]
-
-class RAGQueryEngine(CustomQueryEngine):
-    retriever: BaseRetriever
-    response_synthesizer: BaseSynthesizer
-
-    def custom_query(self, query_str: str, conversation_history: str = ""):
-        print(f"Executing custom query: '{query_str}' with conversation history: '{conversation_history}'")
-        nodes = self.retriever.retrieve(query_str)
-        if not nodes:
-            logging.warning("No relevant nodes found for the query.")
-            # Create a more complete response object with the required methods
-            class Response:
-                def __init__(self):
-                    self.response = "No relevant information found"
-
-                def get_formatted_sources(self):
-                    return []
-
-            response_obj = Response()
-            return response_obj, []
-
-        i = 0
-        rag_retrieved_details = []
-        logging.info("Retrieved nodes:")
-        for x in nodes:
-            i += 1
-            logging.info(f"Node {i}: {x.get_text()[:100]} (Score: {x.get_score()})")
-            print(f"Metadata for Node {i}: {x.metadata}")
-            docu_info = {
-                'chunk': x.get_text(),
-                'score': x.get_score(),
-                'node_id': x.node_id,
-                'file_name': x.metadata.get('file_name', 'Unknown')
-            }
-            rag_retrieved_details.append(docu_info)
-
-        response_obj = self.response_synthesizer.synthesize(query_str, nodes, conversation_history=conversation_history)
-        if not response_obj.response:
-            response_obj.response = "No relevant information found."
-
-        return response_obj, rag_retrieved_details
+            logging.error(f"Streaming answer failed: {e}")
+            yield sse("error", {"error": str(e)})
 
-app = Flask(__name__)
 
 @app.route('/ask', methods=['GET', 'POST'])
-def query_kb():
+def query_kb(stream=False):
     print("Received request...")
     question = ''
     index = ''
@@ -193,6 +189,7 @@ def query_kb():
     if request.method == 'GET':
         question = request.args.get('q', '')
         index = request.args.get('index', '')
+        stream = stream or request.args.get('stream', '').lower() in ('1', 'true')
     elif request.method == 'POST':
         data = request.get_json()
         question = data.get('q', '')
@@ -200,6 +197,7 @@ def query_kb():
         prompt = data.get('prompt', '')
         top_k_str = data.get('top_k', '5')
         conversation_history = data.get('conversation_history', '')
+        stream = stream or bool(data.get('stream', False))
 
     if index == '':
         index = "test"
@@ -212,32 +210,87 @@ def query_kb():
     print(f"Question: {question}")
     print(f"Index: {index}, Top K: {top_k}, Conversation History: {conversation_history}")
 
-    token_counter.reset_counts()
-
-    query_engine = get_query_engine_by_index_name(index, prompt, conversation_history, top_k)
-    if query_engine is None:
-        print("Failed to initialize query engine.")
-        return jsonify({"error": "Failed to initialize query engine for the given index."}), 500
-
-    response, rag_chunk_details = query_engine.custom_query(question, conversation_history)
-    if not hasattr(response, 'response'):
-        print("Response object does not have 'response' attribute.")
-        return jsonify({"response": "No relevant information found.", "rag_chunk_details": []})
-
-    print("Response:", response.response)
-
-    response_data = {
-        'response': response.response,
-        'sources': response.get_formatted_sources(),
-        'total_embedding_token_count': token_counter.total_embedding_token_count,
-        'prompt_llm_token_count': token_counter.prompt_llm_token_count,
-        'completion_llm_token_count': token_counter.completion_llm_token_count,
-        'total_llm_token_count': token_counter.total_llm_token_count,
-        'rag_chunk_details': rag_chunk_details
-    }
-
-    return jsonify(response_data)
+    if stream:
+        return Response(
+            stream_answer(question, index, prompt, top_k, conversation_history),
+            mimetype="text/event-stream",
+            # Proxies must not buffer the events
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
+    with request_metrics() as current:
+        # Paraphrases of a recent question skip retrieval and synthesis altogether.
+        # The embedding is cached, the retriever reuses it on a miss.
+        scope = answer_cache.scope_key(index, prompt, top_k, conversation_history)
+        with stage("embed"):
+            question_embedding = embed_model.get_query_embedding(question)
+        cached = answer_cache.get(scope, question_embedding)
+        if cached is not None:
+            current.cached = True
+            print(f"Answered from cache, similar to: '{cached['cached_question']}' ({cached['similarity']:.3f})")
+            return jsonify({
+                'response': cached['response'],
+                'sources': cached['sources'],
+                'rag_chunk_details': cached['rag_chunk_details'],
+                **current.as_dict(),
+                'cached': True,
+            })
+
+        query_engine = get_query_engine_by_index_name(index, prompt, conversation_history, top_k)
+        if query_engine is None:
+            print("Failed to initialize query engine.")
+            return jsonify({"error": "Failed to initialize query engine for the given index."}), 500
+
+        response, rag_chunk_details = query_engine.custom_query(question, conversation_history, question_embedding)
+        if not hasattr(response, 'response'):
+            print("Response object does not have 'response' attribute.")
+            return jsonify({"response": "No relevant information found.", "rag_chunk_details": []})
+
+        print("Response:", response.response)
+
+        response_data = {
+            'response': response.response,
+            'sources': response.get_formatted_sources(),
+            'rag_chunk_details': rag_chunk_details,
+            'cached': False,
+        }
+
+        # Answers without retrieved context are not worth reusing
+        if rag_chunk_details:
+            answer_cache.set(scope, question, question_embedding, {
+                'response': response_data['response'],
+                'sources': response_data['sources'],
+                'rag_chunk_details': rag_chunk_details,
+            })
+
+        # Read last, so the counts and timings cover the whole request
+        response_data.update(current.as_dict())
+        return jsonify(response_data)
+
+
+@app.route('/ask/stream', methods=['GET', 'POST'])
+def query_kb_stream():
+    return query_kb(stream=True)
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "query_embeddings": query_embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "query_engines": engine_registry.stats(),
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latencies, token totals and cache counters in the Prometheus text format."""
+    body = metrics.render(caches={
+        "query_embeddings": query_embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "query_engines": engine_registry.stats(),
+    })
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/run_indexer', methods=['POST'])
@@ -249,7 +302,11 @@ def run_indexer_endpoint():
         chunk_size = data.get('chunk_size', 512)
         chunk_overlap = data.get('chunk_overlap', 64)
 
-        run_indexer(folder_path, index_table_name, chunk_size, chunk_overlap)
+        try:
+            run_indexer(folder_path, index_table_name, chunk_size, chunk_overlap)
+        finally:
+            # Even a failed run may have changed the table, cached answers could be stale
+            answer_cache.invalidate(index_table_name)
         return jsonify({"status": "Indexing complete"}), 200
     except Exception as e:
         logging.error(f"Error running indexer: {e}")